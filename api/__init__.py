@@ -1,9 +1,13 @@
-from flask import Flask, Blueprint
+from flask import Flask, Blueprint, jsonify
 from flask_cors import CORS
 from .detection import detection_bp
 from .webhook import webhook_bp
 from .analytics import analytics_bp
+from .db import pool_stats, release_request_connections
+from .config import WARMUP_ON_START, STARTUP_TIMINGS, record_startup
+from . import metrics, startup, webhook_queue
 import logging
+import time
 
 logger = logging.getLogger("ServerLogger")
 logging.basicConfig(level=logging.INFO)
@@ -16,7 +20,21 @@ api_bp.register_blueprint(webhook_bp, url_prefix="/webhook")
 api_bp.register_blueprint(analytics_bp, url_prefix="/analytics")
 
 
+# DB pool metrics: in-use count, wait time, connection errors
+@api_bp.route("/db-pools", methods=["GET"])
+def db_pools():
+    return jsonify(pool_stats()), 200
+
+
+# Readiness: 503 until the background warm-up has loaded the model, storage and DB pool
+@api_bp.route("/ready", methods=["GET"])
+def ready():
+    is_ready, details = startup.readiness()
+    return jsonify(details), 200 if is_ready else 503
+
+
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
     CORS(app,resources={r"/*": {"origins": [
     "https://www.daleandcompany.com",    # your Shopify store
@@ -25,6 +43,9 @@ def create_app():
 
     # Register main API blueprint
     app.register_blueprint(api_bp, url_prefix="/api")
+    app.teardown_appcontext(release_request_connections)
+    metrics.init_app(app)  # /metrics + request timing (+ slow-request profiler if enabled)
+    webhook_queue.start()  # flusher; also replays rows spilled by an earlier shutdown
 
     # Optional: check that auth is working
     from .auth import auth_bp
@@ -36,4 +57,10 @@ def create_app():
         else:
             logger.info("Auth blueprint is active. Server health check passed.")
 
+    record_startup("create_app", started)
+    if WARMUP_ON_START:
+        startup.warm_up_async()
+    else:
+        logger.info("Startup timings (ms): %s (model, storage and DB load on first use)", STARTUP_TIMINGS)
+
     return app
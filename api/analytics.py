@@ -1,14 +1,14 @@
 from flask import Blueprint, request, jsonify
-import mysql.connector
-from .config import DB_CONFIG, logger
+from .config import logger
+from . import db, metrics
+from .rollup import dashboard_cache, IMAGE_ROW
 from collections import defaultdict
 
 analytics_bp = Blueprint("analytics", __name__)
 
-# DB connection helper
+# DB connection helper (shared pool)
 def get_db():
-    conn = mysql.connector.connect(**DB_CONFIG)
-    return conn, conn.cursor(dictionary=True)
+    return db.get_db("analytics")
 # ---------------- Per-user dashboard (with granularity filters) ---------------- #
 @analytics_bp.route("/user/<user_id>/dashboard", methods=["GET"])
 def user_dashboard(user_id):
@@ -19,65 +19,66 @@ def user_dashboard(user_id):
     - Detection distribution (by class)
     - Top 5 detection classes
     - 5 highest detections by location (camera from metadata)
+
+    Everything is derived from one read of the user_detection_rollup table,
+    cached in-process for DASHBOARD_CACHE_TTL seconds.
     """
 
     try:
-        conn, cursor = get_db()
+        cached = dashboard_cache.get(user_id)
+        if cached is not None:
+            return jsonify(cached), 200
 
-        # ---------------- Totals ---------------- #
-        cursor.execute("""
-            SELECT COUNT(DISTINCT image_name) AS total_images,
-                   COUNT(*) AS total_detections
-            FROM user_detections
-            WHERE user_id=%s
-        """, (user_id,))
-        totals = cursor.fetchone()
+        conn, cursor = get_db()
+        with metrics.timer(metrics.QUERY_SECONDS, "dashboard_rollup"):
+            cursor.execute("""
+                SELECT detected_class, camera,
+                       SUM(image_count) AS images,
+                       SUM(detection_count) AS detections
+                FROM user_detection_rollup
+                WHERE user_id=%s
+                GROUP BY detected_class, camera
+            """, (user_id,))
+            rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
 
-        # ---------------- Detection Distribution (all classes) ---------------- #
-        cursor.execute("""
-            SELECT detected_class, COUNT(*) AS count
-            FROM user_detections
-            WHERE user_id=%s
-            GROUP BY detected_class
-            ORDER BY count DESC
-        """, (user_id,))
-        detection_distribution = cursor.fetchall()
+        total_images = 0
+        by_class = defaultdict(int)
+        by_camera = defaultdict(int)
+        for r in rows:
+            if r["detected_class"] == IMAGE_ROW:
+                total_images += int(r["images"])
+                continue
+            count = int(r["detections"])
+            by_class[r["detected_class"]] += count
+            if r["camera"]:
+                by_camera[r["camera"]] += count
 
-        # ---------------- Top 5 Class Detections ---------------- #
-        cursor.execute("""
-            SELECT detected_class, COUNT(*) AS count
-            FROM user_detections
-            WHERE user_id=%s
-            GROUP BY detected_class
-            ORDER BY count DESC
-            LIMIT 5
-        """, (user_id,))
-        top_classes = cursor.fetchall()
+        # ---------------- Detection Distribution / Top 5 classes ---------------- #
+        detection_distribution = [
+            {"detected_class": cls, "count": count}
+            for cls, count in sorted(by_class.items(), key=lambda kv: kv[1], reverse=True)
+            if count > 0
+        ]
 
         # ---------------- 5 Highest Detections by Location ---------------- #
-        cursor.execute("""
-            SELECT JSON_UNQUOTE(JSON_EXTRACT(metadata, '$.camera')) AS location,
-                   COUNT(*) AS count
-            FROM user_detections
-            WHERE user_id=%s
-              AND JSON_EXTRACT(metadata, '$.camera') IS NOT NULL
-            GROUP BY location
-            ORDER BY count DESC
-            LIMIT 5
-        """, (user_id,))
-        top_locations = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
+        top_locations = [
+            {"location": camera, "count": count}
+            for camera, count in sorted(by_camera.items(), key=lambda kv: kv[1], reverse=True)[:5]
+            if count > 0
+        ]
 
-        return jsonify({
+        payload = {
             "user_id": user_id,
-            "total_images": totals["total_images"],
-            "total_detections": totals["total_detections"],
+            "total_images": total_images,
+            "total_detections": sum(by_class.values()),
             "detection_distribution": detection_distribution,
-            "top_classes": top_classes,
+            "top_classes": detection_distribution[:5],
             "top_locations": top_locations
-        }), 200
+        }
+        dashboard_cache.set(user_id, payload)
+        return jsonify(payload), 200
 
     except Exception as e:
         logger.error(f"Error building dashboard for user {user_id}: {e}", exc_info=True)
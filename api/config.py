@@ -1,9 +1,12 @@
 import os
+import time
 import logging
-from ultralytics import YOLO
+import threading
 from dotenv import load_dotenv
-from google.cloud import storage
-import torch
+import yaml
+
+# Heavy clients (ultralytics/torch, google-cloud-storage) are imported on first use, not here
+_import_started = time.perf_counter()
 
 # =========================================================
 # Load environment variables
@@ -43,6 +46,13 @@ logger.info("Running in %s environment", ENV)
 SHOPIFY_STORE = os.getenv("SHOPIFY_STORE")
 SHOPIFY_ACCESS_TOKEN = os.getenv("SHOPIFY_ACCESS_TOKEN")
 NGROK_AUTH_TOKEN = os.getenv("NGROK_AUTH_TOKEN")
+SHOPIFY_WEBHOOK_SECRET = os.getenv("SHOPIFY_WEBHOOK_SECRET")                    # HMAC key; unverified only in DEV
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "500"))                   # rows per upsert
+WEBHOOK_FLUSH_INTERVAL = float(os.getenv("WEBHOOK_FLUSH_INTERVAL", "2"))           # seconds between flushes
+WEBHOOK_DEDUP_TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", "86400"))                 # Shopify retries for up to 48h...
+WEBHOOK_DEDUP_MAX = int(os.getenv("WEBHOOK_DEDUP_MAX", "100000"))                  # ...but one day of ids is plenty
+WEBHOOK_QUEUE_MAX = int(os.getenv("WEBHOOK_QUEUE_MAX", "50000"))                   # pending rows before spilling to disk
+WEBHOOK_SPILL_DIR = os.getenv("WEBHOOK_SPILL_DIR", os.path.join(BASE_DIR, "webhook_spill"))
 
 # =========================================================
 # Database config
@@ -64,73 +74,263 @@ else:  # PRODUCTION
 
 logger.info("Database host: %s", DB_CONFIG["host"])
 
+# Connection pools (api/db.py). Each blueprint has its own pool; any setting can be
+# overridden per pool, e.g. DB_POOL_SIZE_WEBHOOK=2.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))              # seconds to wait for a free connection
+DB_POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", "30"))  # ping idle connections older than this
+
 # =========================================================
 # Storage configuration
 # =========================================================
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploaded_images")
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(BASE_DIR, "uploaded_images"))
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Define placeholders so imports don’t break
-gcs_client = None
-gcs_bucket = None
 GCS_UPLOAD_DIR = "uploaded_images/"
+GCS_KEY_PATH = None
+GCS_BUCKET_NAME = None
 
 if ENV == "DEV":
     STORAGE_BACKEND = os.getenv("DEV_STORAGE_BACKEND", "local").lower()
-    logger.info("Using LOCAL storage backend. Files will be saved in: %s", UPLOAD_DIR)
-
 else:  # PRODUCTION
     STORAGE_BACKEND = os.getenv("PROD_STORAGE_BACKEND", "gcs").lower()
     GCS_KEY_PATH = os.getenv("PROD_GOOGLE_APPLICATION_CREDENTIALS")
     GCS_BUCKET_NAME = os.getenv("PROD_GCS_BUCKET_NAME")
 
-    if STORAGE_BACKEND == "gcs":
-        logger.info("Using GCS backend")
-        try:
-            if not GCS_KEY_PATH or not os.path.exists(GCS_KEY_PATH):
-                raise FileNotFoundError(f"Invalid GCS key path: {GCS_KEY_PATH}")
-            if not GCS_BUCKET_NAME:
-                raise ValueError("Missing PROD_GCS_BUCKET_NAME in .env")
-
-            gcs_client = storage.Client.from_service_account_json(GCS_KEY_PATH)
-            gcs_bucket = gcs_client.bucket(GCS_BUCKET_NAME)
-
-            # Ensure uploaded_images/ exists remotely
-            blobs = list(gcs_bucket.list_blobs(prefix=GCS_UPLOAD_DIR))
-            if not blobs:
-                placeholder = gcs_bucket.blob(GCS_UPLOAD_DIR + ".keep")
-                placeholder.upload_from_string("")
-                logger.info("Created remote folder: %s", GCS_UPLOAD_DIR)
-            else:
-                logger.info(
-                    "Remote folder '%s' already exists with %d file(s).",
-                    GCS_UPLOAD_DIR, len(blobs)
-                )
-
-            logger.info("Connected to GCS bucket: %s", GCS_BUCKET_NAME)
+if STORAGE_BACKEND == "gcs":
+    logger.info("Using GCS backend (bucket: %s)", GCS_BUCKET_NAME)
+else:
+    logger.info("Using LOCAL storage backend. Files will be saved in: %s", UPLOAD_DIR)
 
-        except Exception as e:
-            logger.error("Failed to connect to GCS: %s", e)
-    else:
-        logger.info("Using LOCAL storage backend. Files will be saved in: %s", UPLOAD_DIR)
+# =========================================================
+# Lazy initialisation + startup timings
+# =========================================================
+# Load model / GCS / DB pool on a background thread at startup (api/startup.py) instead of on first request
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "1" if ENV != "DEV" else "0") == "1"
+MODEL_LOAD_RETRY = float(os.getenv("MODEL_LOAD_RETRY", "30"))  # seconds before a failed model load is tried again
+
+STARTUP_TIMINGS = {}  # component -> milliseconds, logged as each one comes up
+_gcs_lock = threading.Lock()
+_model_lock = threading.Lock()
+_gcs_bucket = None
+_model = None
+_model_error = None
+_model_failed_at = 0.0
+
+
+def record_startup(component, started):
+    STARTUP_TIMINGS[component] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Startup: %s took %.1f ms", component, STARTUP_TIMINGS[component])
+
+
+def get_gcs_bucket():
+    """GCS bucket handle, connected on first use."""
+    global _gcs_bucket
+    if _gcs_bucket is not None:
+        return _gcs_bucket
+    with _gcs_lock:
+        if _gcs_bucket is not None:
+            return _gcs_bucket
+        started = time.perf_counter()
+        if not GCS_KEY_PATH or not os.path.exists(GCS_KEY_PATH):
+            raise FileNotFoundError(f"Invalid GCS key path: {GCS_KEY_PATH}")
+        if not GCS_BUCKET_NAME:
+            raise ValueError("Missing PROD_GCS_BUCKET_NAME in .env")
+
+        from google.cloud import storage
+        client = storage.Client.from_service_account_json(GCS_KEY_PATH)
+        bucket = client.bucket(GCS_BUCKET_NAME)
+
+        # Ensure uploaded_images/ exists remotely: one object lookup, not a listing of every upload
+        placeholder = bucket.blob(GCS_UPLOAD_DIR + ".keep")
+        if not placeholder.exists():
+            placeholder.upload_from_string("")
+            logger.info("Created remote folder: %s", GCS_UPLOAD_DIR)
+
+        logger.info("Connected to GCS bucket: %s", GCS_BUCKET_NAME)
+        _gcs_bucket = bucket
+        record_startup("gcs", started)
+        return _gcs_bucket
+
+
+# Objects are stored under their content hash (api/storage.py)
+STORAGE_UPLOAD_WORKERS = int(os.getenv("STORAGE_UPLOAD_WORKERS", "4"))
+GCS_CHUNK_SIZE = int(os.getenv("GCS_CHUNK_SIZE", str(8 * 1024 * 1024)))  # resumable chunk, multiple of 256 KiB
+GCS_SIGNED_URL_TTL = int(os.getenv("GCS_SIGNED_URL_TTL", str(7 * 24 * 3600)))
+# Signed URLs are reused from memory (api/urls.py) until this long before they expire
+SIGNED_URL_REFRESH_MARGIN = int(os.getenv("SIGNED_URL_REFRESH_MARGIN", "3600"))
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", "100000"))
+
+# Resized variants for the gallery (api/thumbnails.py), cached on local disk with LRU eviction
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", os.path.join(BASE_DIR, "thumbnail_cache"))
+THUMBNAIL_CACHE_MAX_MB = int(os.getenv("THUMBNAIL_CACHE_MAX_MB", "512"))
+THUMBNAIL_SIZES = {"thumb": 320, "small": 640, "medium": 1280}
+THUMBNAIL_MAX_WIDTH = 2048
+THUMBNAIL_JPEG_QUALITY = int(os.getenv("THUMBNAIL_JPEG_QUALITY", "85"))
+# Named sizes to build in the background at upload time, e.g. "thumb,small" ("" to disable)
+THUMBNAIL_PREGENERATE = [n for n in os.getenv("THUMBNAIL_PREGENERATE", "thumb").split(",") if n.strip()]
 
 # =========================================================
 # YOLO model loading
 # =========================================================
-MODEL_PATH = os.path.join(BASE_DIR, "walidlife_models", "best_deer_detection_openvino_model")
-logger.info("Loading YOLO model from %s", MODEL_PATH)
+# MODEL_VARIANT picks an alternative export next to the default FP32 one, e.g. "int8" ->
+# best_deer_detection_int8_openvino_model (yolo export format=openvino int8=True / half=True)
+MODEL_VARIANT = os.getenv("MODEL_VARIANT", "").lower()
+MODEL_PATH = os.path.join(
+    BASE_DIR, "walidlife_models",
+    f"best_deer_detection_{MODEL_VARIANT}_openvino_model" if MODEL_VARIANT else "best_deer_detection_openvino_model"
+)
 
+
+def get_model():
+    """
+    YOLO model, loaded once per process on first use. Returns None if loading failed;
+    a failed load is tried again once MODEL_LOAD_RETRY seconds have passed.
+    """
+    global _model, _model_error, _model_failed_at
+    if _model is not None or (_model_error is not None and time.monotonic() - _model_failed_at < MODEL_LOAD_RETRY):
+        return _model
+    with _model_lock:
+        if _model is not None or (_model_error is not None and time.monotonic() - _model_failed_at < MODEL_LOAD_RETRY):
+            return _model
+        started = time.perf_counter()
+        logger.info("Loading YOLO model from %s", MODEL_PATH)
+        try:
+            from ultralytics import YOLO
+            _model = YOLO(MODEL_PATH, task="detect")
+            # model.to("cpu")
+            from .inference import prepare_model
+            prepare_model(_model)  # OpenVINO runtime settings + warm-up inference
+            logger.info("YOLO model loaded successfully.")
+            _model_error = None
+        except Exception as e:
+            logger.error("Failed to load YOLO model: %s", e)
+            _model = None
+            _model_error = e
+            _model_failed_at = time.monotonic()
+        record_startup("model", started)
+        return _model
+
+# Input size / batch shape baked into the OpenVINO export
+MODEL_IMGSZ = 640
+MODEL_MAX_BATCH = 1
+MODEL_DYNAMIC = False
 try:
-    model = YOLO(MODEL_PATH, task="detect")
-    # model.to("cpu")
-    logger.info("YOLO model loaded successfully.")
+    with open(os.path.join(MODEL_PATH, "metadata.yaml")) as f:
+        model_meta = yaml.safe_load(f) or {}
+    MODEL_IMGSZ = int(model_meta.get("imgsz", [MODEL_IMGSZ])[0])
+    MODEL_MAX_BATCH = int(model_meta.get("batch", MODEL_MAX_BATCH))
+    MODEL_DYNAMIC = bool(model_meta.get("args", {}).get("dynamic", False))
 except Exception as e:
-    logger.error("Failed to load YOLO model: %s", e)
-    model = None
+    logger.warning("Could not read model metadata, assuming %dpx / batch 1: %s", MODEL_IMGSZ, e)
+
+# Input resolution override; only dynamic exports accept a size other than the exported one
+if os.getenv("INFERENCE_IMGSZ"):
+    if MODEL_DYNAMIC:
+        MODEL_IMGSZ = int(os.getenv("INFERENCE_IMGSZ"))
+    else:
+        logger.warning("INFERENCE_IMGSZ ignored: static export only accepts %dpx", MODEL_IMGSZ)
+
+# =========================================================
+# OpenVINO runtime tuning (applied by inference.prepare_model)
+# =========================================================
+OV_DEVICE = os.getenv("OV_DEVICE", "CPU")                           # GPU compiles have failed before, see kernel.errors.txt
+OV_PERFORMANCE_HINT = os.getenv("OV_PERFORMANCE_HINT", "").upper()  # LATENCY | THROUGHPUT | CUMULATIVE_THROUGHPUT
+OV_NUM_THREADS = int(os.getenv("OV_NUM_THREADS", "0"))              # 0 = runtime default
+OV_NUM_STREAMS = os.getenv("OV_NUM_STREAMS", "")                    # e.g. 2, or AUTO
+OV_PRECISION_HINT = os.getenv("OV_PRECISION_HINT", "").lower()      # f32 | f16 | bf16
+MODEL_WARMUP_RUNS = int(os.getenv("MODEL_WARMUP_RUNS", "1"))
 
+# =========================================================
+# Inference settings
+# =========================================================
+# Frames per model call. Static exports only accept their exported batch size, so this is
+# honoured as-is for dynamic exports, or when a THROUGHPUT hint runs each frame as its own request.
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "8"))
+
+# Optional shared inference server (python -m api.inference_server). When set, web workers
+# don't load the model and send frames there over shared memory instead.
+# Unix socket path only: frames go through shared memory, so client and server share a host
+# anyway, and the protocol unpickles what it receives.
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "")
+INFERENCE_SERVER_AUTHKEY = os.getenv("INFERENCE_SERVER_AUTHKEY", "buck-tracker").encode()
+INFERENCE_SERVER_TIMEOUT = float(os.getenv("INFERENCE_SERVER_TIMEOUT", "120"))   # seconds per predict call
+INFERENCE_SERVER_BATCH = int(os.getenv("INFERENCE_SERVER_BATCH", "0"))           # 0 = effective model batch
+INFERENCE_SERVER_MAX_WAIT_MS = float(os.getenv("INFERENCE_SERVER_MAX_WAIT_MS", "10"))  # batching deadline
+
+# Seconds a user's dashboard aggregates are served from the in-process cache
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "30"))
+
+# Decode JPEGs at 1/2, 1/4 or 1/8 scale (DCT scaling) when the model input is that much smaller
+REDUCED_DECODE = os.getenv("REDUCED_DECODE", "1") == "1"
+
+# Threads for hash / decode / EXIF work ahead of inference (cv2 and hashlib release the GIL)
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+# =========================================================
+# Empty-frame prefilter (api/prefilter.py): skip the detector on wind/sun false triggers
+# =========================================================
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "0") == "1"
+PREFILTER_SIZE = (160, 120)                                                   # compared thumbnail, px
+PREFILTER_PIXEL_DELTA = float(os.getenv("PREFILTER_PIXEL_DELTA", "18"))       # grey levels that count as a change
+PREFILTER_MIN_CHANGED = float(os.getenv("PREFILTER_MIN_CHANGED", "0.001"))    # changed fraction needed to run YOLO
+PREFILTER_WINDOW_SECONDS = float(os.getenv("PREFILTER_WINDOW_SECONDS", "3600"))  # peers: same camera, this close
+PREFILTER_BURST_SECONDS = float(os.getenv("PREFILTER_BURST_SECONDS", "30"))   # ...but not from the same trigger
+PREFILTER_MIN_PEERS = int(os.getenv("PREFILTER_MIN_PEERS", "2"))
+
+# =========================================================
+# Detection result cache (api/result_cache.py): file hash + model + settings -> boxes
+# =========================================================
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join(BASE_DIR, "result_cache.sqlite3"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "200000"))
+
+# =========================================================
+# Async jobs (api/jobs.py): SQLite job store + spooled uploads, no external broker
+# =========================================================
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(BASE_DIR, "jobs.sqlite3"))
+JOBS_SPOOL_DIR = os.getenv("JOBS_SPOOL_DIR", os.path.join(BASE_DIR, "job_spool"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))                        # worker threads per process
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+
+
+# =========================================================
+# Metrics (/metrics) + slow-request sampling profiler (api/metrics.py)
+# =========================================================
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))  # 0 = profiler off
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+# =========================================================
+# Bulk edit endpoints
+# =========================================================
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "1000"))  # images / detections per request
+
+# =========================================================
+# Sequence ingestion (bursts and clips, see api/sequences.py)
+# =========================================================
+SEQUENCE_BURST_GAP = float(os.getenv("SEQUENCE_BURST_GAP", "10"))         # seconds between shots of one burst
+SEQUENCE_SAMPLE_FRAMES = int(os.getenv("SEQUENCE_SAMPLE_FRAMES", "3"))     # frames per sequence sent to the model
+SEQUENCE_TRACK_IOU = float(os.getenv("SEQUENCE_TRACK_IOU", "0.3"))         # box overlap that counts as the same animal
+SEQUENCE_STORE_CLIPS = os.getenv("SEQUENCE_STORE_CLIPS", "1") == "1"       # keep the original video next to its frame
+SEQUENCE_MAX_CLIP_MB = int(os.getenv("SEQUENCE_MAX_CLIP_MB", "200"))       # largest video accepted per file
+SEQUENCE_MAX_REQUEST_MB = int(os.getenv("SEQUENCE_MAX_REQUEST_MB", "1024"))  # all files of one sequence-mode request
+
+# =========================================================
+# Detection export
+# =========================================================
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "2000"))                # rows per fetch from the cursor
+EXPORT_PARQUET_ROW_GROUP = int(os.getenv("EXPORT_PARQUET_ROW_GROUP", "50000"))  # rows per Parquet row group
 
 # =========================================================image# Allowed image types
 # =========================================================
 
 # Allowed image types
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp"}
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".avi", ".m4v"}  # sequence mode only
+
+record_startup("config", _import_started)
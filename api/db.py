@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+from mysql.connector import errors
+from flask import g, has_app_context
+
+from .config import logger, DB_CONFIG, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_PING_INTERVAL
+
+
+class PoolTimeout(errors.PoolError):
+    pass
+
+
+# ---------------- Pooled connection ---------------- #
+class PooledConnection:
+    """Wraps a mysql connection; close() hands it back to the pool instead of disconnecting."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise errors.OperationalError("Connection already returned to pool")
+        return getattr(self._raw, name)
+
+    @property
+    def closed(self):
+        return self._raw is None
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw)
+
+    def discard(self):
+        """Drop the connection instead of returning it, e.g. with an unbuffered result left unread."""
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.discard(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------- Pool ---------------- #
+class ConnectionPool:
+    def __init__(self, name, size, timeout, ping_interval, config):
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.config = config
+
+        self._idle = deque()  # (raw connection, last released at)
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+        self.in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connection_errors = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def get_connection(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No free connection in pool '{self.name}' after {self.timeout}s")
+        waited = time.perf_counter() - start
+
+        try:
+            raw = self._checkout()
+        except Exception:
+            with self._lock:
+                self.connection_errors += 1
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return PooledConnection(self, raw)
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                item = self._idle.pop() if self._idle else None
+            if item is None:
+                return self._connect()
+
+            raw, released_at = item
+            if time.monotonic() - released_at < self.ping_interval:
+                return raw
+            # Idle long enough that the server may have dropped it (wait_timeout, Cloud SQL restarts)
+            try:
+                raw.ping(reconnect=True, attempts=2, delay=0)
+                return raw
+            except errors.Error as e:
+                logger.warning("Dropping dead connection from pool '%s': %s", self.name, e)
+                with self._lock:
+                    self.connection_errors += 1
+                self._discard(raw)
+
+    def _connect(self):
+        return mysql.connector.connect(**self.config)
+
+    def _release(self, raw):
+        try:
+            # End any open transaction so the next user doesn't inherit locks or a stale snapshot
+            raw.rollback()
+        except errors.Error:
+            self._discard(raw)
+        else:
+            with self._lock:
+                self._idle.append((raw, time.monotonic()))
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def discard(self, raw):
+        """Close a checked-out connection without rollback and free its slot."""
+        try:
+            # shutdown() closes the socket without QUIT, which would first drain any unread result
+            raw.shutdown()
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "connection_errors": self.connection_errors,
+                "wait_seconds_total": round(self.wait_seconds_total, 4),
+                "wait_seconds_max": round(self.wait_seconds_max, 4),
+            }
+
+
+# ---------------- Named pools ---------------- #
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_setting(name, key, default, cast):
+    value = os.getenv(f"{key}_{name.upper()}")
+    return cast(value) if value is not None else default
+
+
+def get_pool(name="default"):
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = ConnectionPool(
+                    name,
+                    size=_pool_setting(name, "DB_POOL_SIZE", DB_POOL_SIZE, int),
+                    timeout=_pool_setting(name, "DB_POOL_TIMEOUT", DB_POOL_TIMEOUT, float),
+                    ping_interval=_pool_setting(name, "DB_POOL_PING_INTERVAL", DB_POOL_PING_INTERVAL, float),
+                    config=DB_CONFIG,
+                )
+                _pools[name] = pool
+                logger.info("Created DB pool '%s' (size=%d)", name, pool.size)
+    return pool
+
+
+def get_db(pool="default", dictionary=True, buffered=False):
+    """Check out a pooled connection plus cursor. conn.close() returns it to the pool."""
+    conn = get_pool(pool).get_connection()
+    if has_app_context():
+        # Safety net: anything a request forgets to close is returned at teardown
+        g.setdefault("_db_connections", []).append(conn)
+    return conn, conn.cursor(dictionary=dictionary, buffered=buffered)
+
+
+def release_request_connections(exc=None):
+    for conn in g.pop("_db_connections", []):
+        if not conn.closed:
+            conn.close()
+
+
+def pool_stats():
+    return {name: pool.stats() for name, pool in list(_pools.items())}
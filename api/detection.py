@@ -1,52 +1,351 @@
 import warnings
 warnings.filterwarnings("ignore", message="Corrupt JPEG data")
 
-from flask import Blueprint, request, jsonify,url_for,send_from_directory, make_response
-import cv2, uuid, os
-import numpy as np
-from datetime import datetime,timedelta
-import json ,hashlib ,mysql.connector
-
-from PIL import Image, ExifTags   # for metadata
-from io import BytesIO
-from .utils import extract_metadata
-
+from flask import Blueprint, request, jsonify,url_for,send_file, make_response, redirect, Response, stream_with_context
+import os
+import threading
+from datetime import datetime
+import json, base64
+
+from functools import partial
+from . import db, export, jobs, metrics, sequences, thumbnails, urls
+from .urls import image_url
+from .rollup import AMBIGUOUS, RollupDelta, camera_of, find_image, invalidate as invalidate_rollup
+from .pipeline import StageTimer, hash_uploads, iter_detections
+
+from .storage import storage, GCSStorage, object_key, put_async, delete_async
 from .config import (
-    logger, UPLOAD_DIR, model, DB_CONFIG,
-    gcs_bucket, GCS_UPLOAD_DIR, STORAGE_BACKEND, ALLOWED_EXTENSIONS
+    logger, ALLOWED_EXTENSIONS, VIDEO_EXTENSIONS, BULK_MAX_ITEMS, SEQUENCE_MAX_CLIP_MB,
+    SEQUENCE_MAX_REQUEST_MB
 )
 
 detection_bp = Blueprint("detection", __name__)
 
-# DB connection (allow optional buffered cursor)
+# DB connection from the shared pool (allow optional buffered cursor)
 def get_db(buffered=False):
-    conn = mysql.connector.connect(**DB_CONFIG)
-    return conn, conn.cursor(dictionary=True, buffered=buffered)
+    return db.get_db("detection", buffered=buffered)
 
 
-# Serve uploaded images
+# Serve uploaded images (filename is the storage key); ?w=<px> or ?size=thumb|small|medium for a resized variant
 @detection_bp.route("/uploads/<filename>")
 def serve_upload(filename):
-    # Get full file path
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
-    # Ensure the file exists
-    if not os.path.exists(file_path):
+    try:
+        width = thumbnails.parse_width(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    if width is None and isinstance(storage, GCSStorage):
+        # Originals live in the bucket; hand the browser a (cached) signed URL
+        return redirect(image_url(filename), code=302)
+
+    # Ensure the file exists (cached variants are served without touching storage)
+    try:
+        if width is None:
+            if not storage.exists(filename):
+                raise FileNotFoundError(filename)
+            path = storage.path(filename)
+        else:
+            path = thumbnails.get_variant(filename, width)
+    except FileNotFoundError:
         return {"error": "File not found"}, 404
 
-    # Serve the file
-    response = make_response(send_from_directory(UPLOAD_DIR, filename))
+    # Serve the file (conditional GET: If-None-Match / If-Modified-Since -> 304)
+    response = make_response(send_file(path, conditional=True, etag=thumbnails.etag_for(filename, width) or True))
     
     #  Add CORS header so browsers can safely display image from ngrok
     response.headers['Access-Control-Allow-Origin'] = '*'
     response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
     response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
     
-    # Optional: set cache control for faster loading
-    response.headers['Cache-Control'] = 'public, max-age=3600'
+    # Content-addressed keys never change, so browsers can cache for a long time
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
     
     return response
+
+
 # ---------------- Image Upload & Detection ---------------- #
+RESULT_FIELDS = ("image_name", "image_url", "timestamp", "status", "objects", "metadata")
+
+
+def parse_fields(value):
+    """?fields=image_name,objects -> the result keys to keep; None keeps everything."""
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(",") if f.strip()]
+    unknown = set(fields) - set(RESULT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields {sorted(unknown)}, use any of {list(RESULT_FIELDS)}")
+    return fields
+
+
+def select_fields(result, fields):
+    return result if fields is None else {k: result[k] for k in fields}
+
+
+def process_batch(user_id, uploads, timer=None, first_batch=None, representatives=None):
+    """
+    Core of /process-images, shared by the sync endpoint and async jobs.
+    uploads: list of (filename, file_bytes). Needs a request context for image URLs.
+    representatives: {file_hash: {"detections", "metadata"}} for sequence frames from
+    sequences.collapse(); those are stored with the given detections.
+    Yields ("result", image_result) as each image finishes, then ("summary", response).
+    """
+    representatives = representatives or {}
+    timer = timer or StageTimer()
+    results_list = []
+    duplicates = []
+    failed = []
+    prefiltered = []  # judged empty by the prefilter, stored without running the detector
+    image_rows = []
+    detection_rows = []
+    rollup = RollupDelta()
+    uploaded_at = datetime.utcnow()
+    stored = {}  # file_hash -> (storage key, upload future, bytes)
+    committed = False
+
+    try:
+        uploads = hash_uploads(uploads, timer)
+
+        # Check duplicates for the whole batch in one indexed lookup. Pooled connections
+        # are held only around the queries, not through decode and inference
+        with timer.stage("dedup"):
+            conn, cursor = get_db()
+            try:
+                seen = _known_hashes(cursor, user_id, [file_hash for _, _, file_hash in uploads])
+            finally:
+                cursor.close()
+                conn.close()
+
+        new_uploads = []
+        for filename, file_bytes, file_hash in uploads:
+            if file_hash in seen:
+                duplicates.append(filename)
+                continue
+            seen.add(file_hash)  # same file twice in one batch
+            new_uploads.append((filename, file_bytes, file_hash))
+            # Original bytes go to storage in the background while the batch is decoded and inferred
+            key = object_key(file_hash, filename)
+            stored[file_hash] = (key, put_async(key, file_bytes), file_bytes)
+            thumbnails.pregenerate_async(key, file_bytes)
+
+        def accept(prepared):
+            if prepared["frame"] is None and prepared["cached"] is None:
+                failed.append(prepared["filename"])
+                return False
+            return True
+
+        # Decode/EXIF run on a thread pool and stream into batched inference
+        precomputed = {h: r["detections"] for h, r in representatives.items()}
+        for prepared, detections in iter_detections(new_uploads, timer, accept=accept, first_batch=first_batch,
+                                                    precomputed=precomputed):
+            filename, metadata = prepared["filename"], prepared["metadata"]
+            key = stored[prepared["file_hash"]][0]
+            sequence = representatives.get(prepared["file_hash"])
+            if sequence is not None:
+                metadata["sequence"] = sequence["metadata"]
+
+            # Rows are written in one go after the loop
+            camera = camera_of(metadata)
+            image_rows.append((user_id, prepared["file_hash"], filename, key, json.dumps(metadata), camera or None,
+                               prepared["exif"].captured_at, prepared["status"], len(detections),
+                               sequence["metadata"].get("clip_key") if sequence else None, uploaded_at))
+            if prepared["status"] == "prefiltered":
+                prefiltered.append(filename)
+            rollup.image(user_id, camera, uploaded_at.date())
+            for det in detections:
+                detection_rows.append((prepared["file_hash"], user_id, filename, det["class"], det["conf"],
+                                       json.dumps(det["bbox"])))
+                rollup.detection(user_id, det["class"], camera, uploaded_at.date())
+
+            full_url = image_url(key)
+
+            result = {
+                "image_name": filename,
+                "image_url": full_url,  #  full browser-accessible URL
+                "timestamp": datetime.utcnow().isoformat(),
+                "status": prepared["status"],
+                "objects": detections,
+                "metadata": metadata
+            }
+            results_list.append(result)
+            yield "result", result
+
+        # Rows must not point at objects that failed to store
+        with timer.stage("storage_wait"):
+            for key, future, _ in stored.values():
+                future.result()
+
+        # Single transaction, multi-row inserts (executemany batches INSERT ... VALUES)
+        with timer.stage("db_write"):
+            conn, cursor = get_db()
+            try:
+                _write_rows(cursor, user_id, image_rows, detection_rows, representatives, rollup)
+                conn.commit()
+                committed = True
+            finally:
+                cursor.close()
+                conn.close()
+
+        # An object that was already stored may have been deleted with its last image
+        # before our rows went in (_delete_images); put those back
+        with timer.stage("storage_wait"):
+            for key, future, file_bytes in stored.values():
+                if not future.result() and not storage.exists(key):
+                    put_async(key, file_bytes).result()
+    finally:
+        if not committed and (stored or representatives):
+            # Failed or abandoned (e.g. a streaming client went away) before the rows went in
+            clip_keys = {r["metadata"]["clip_key"] for r in representatives.values() if r["metadata"].get("clip_key")}
+            threading.Thread(target=_discard_uncommitted, args=(list(stored.values()), clip_keys),
+                             name="discard-uncommitted", daemon=True).start()
+    invalidate_rollup(rollup.users())
+
+    response = {
+        "status": "success",
+        "user_id": user_id,
+        "images_processed": len(results_list),
+        "total_detections": len(detection_rows),
+        "duplicates": duplicates,
+        "failed": failed,
+        "prefiltered": prefiltered,
+        "results": results_list,
+        "timings_ms": timer.as_ms()
+    }
+    if duplicates:
+        response["message"] = f"Skipped {len(duplicates)} duplicate file(s)"
+    if failed:
+        logger.warning("Could not decode %d upload(s): %s", len(failed), failed)
+
+    yield "summary", response
+
+
+def _write_rows(cursor, user_id, image_rows, detection_rows, representatives, rollup):
+    """process_batch's inserts: images, then detections and sequence sources by image id."""
+    if image_rows:
+        cursor.executemany("""
+            INSERT INTO user_images (user_id, file_hash, image_name, storage_key, metadata,
+                                     camera, captured_at, status, detection_count, clip_key, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE id = id
+        """, image_rows)
+    # Detections and sequence sources point at their image row by id; filenames repeat
+    sources = {row[1]: representatives[row[1]]["sources"] for row in image_rows if row[1] in representatives}
+    hashes = list({row[0] for row in detection_rows} | set(sources))
+    if hashes:
+        placeholders = ", ".join(["%s"] * len(hashes))
+        cursor.execute(f"SELECT id, file_hash FROM user_images WHERE user_id=%s AND file_hash IN ({placeholders})",
+                       [user_id] + hashes)
+        image_ids = {r["file_hash"]: r["id"] for r in cursor.fetchall()}
+    if detection_rows:
+        cursor.executemany("""
+            INSERT INTO user_detections (image_id, user_id, image_name, detected_class, confidence, bbox)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, [(image_ids[row[0]],) + row[1:] for row in detection_rows])
+    if sources:
+        cursor.executemany("""
+            INSERT IGNORE INTO user_image_sources (user_id, file_hash, image_id)
+            VALUES (%s, %s, %s)
+        """, [(user_id, source, image_ids[file_hash])
+              for file_hash, source_hashes in sources.items() for source in source_hashes])
+    rollup.apply(cursor)
+
+
+def _discard_uncommitted(stored, clip_keys):
+    """
+    Remove objects a batch put in storage but never wrote rows for, unless some other
+    row references them. On its own thread: it waits for uploads still in flight.
+    """
+    try:
+        keys = set()
+        for key, future, _ in stored:
+            try:
+                if future.result():  # False: the object was already there, not ours to remove
+                    keys.add(key)
+            except Exception:
+                pass  # never stored
+        if not keys and not clip_keys:
+            return
+        conn, cur = get_db()
+        try:
+            orphaned = _unreferenced(cur, "storage_key", keys)
+            orphaned_clips = _unreferenced(cur, "clip_key", clip_keys)
+            conn.commit()
+        finally:
+            cur.close(); conn.close()
+        for key in orphaned + orphaned_clips:
+            delete_async(key)
+        for key in orphaned:
+            thumbnails.discard_async(key)
+        if orphaned or orphaned_clips:
+            logger.info("Removed %d object(s) of an unfinished batch", len(orphaned) + len(orphaned_clips))
+    except Exception as e:
+        logger.error("Could not clean up objects of an unfinished batch: %s", e, exc_info=True)
+
+
+def _known_hashes(cursor, user_id, hashes):
+    """Which of these content hashes the user already has, stored or folded into a sequence."""
+    hashes = list(set(hashes))
+    if not hashes:
+        return set()
+    placeholders = ", ".join(["%s"] * len(hashes))
+    cursor.execute(f"""
+        SELECT file_hash FROM user_images WHERE user_id=%s AND file_hash IN ({placeholders})
+        UNION
+        SELECT file_hash FROM user_image_sources WHERE user_id=%s AND file_hash IN ({placeholders})
+    """, [user_id] + hashes + [user_id] + hashes)
+    return {row["file_hash"] for row in cursor.fetchall()}
+
+
+def process_sequence_batch(user_id, uploads, timer=None, first_batch=None):
+    """
+    process_batch for mode=sequence: bursts and clips are first collapsed into one
+    representative frame each (api/sequences.py), which is all that gets stored.
+    Files seen before, on their own or as part of a sequence, are dropped up front.
+    """
+    timer = timer or StageTimer()
+    uploads = hash_uploads(uploads, timer)
+    conn, cursor = get_db()
+    try:
+        with timer.stage("dedup"):
+            seen = _known_hashes(cursor, user_id, [file_hash for _, _, file_hash in uploads])
+    finally:
+        cursor.close()
+        conn.close()
+    fresh, duplicates = [], []
+    for upload in uploads:
+        if upload[2] in seen:
+            duplicates.append(upload[0])
+            continue
+        seen.add(upload[2])  # same file twice in one batch
+        fresh.append(upload)
+
+    frames, representatives, unreadable = sequences.collapse(fresh, timer) if fresh else ([], {}, [])
+    for kind, payload in process_batch(user_id, frames, timer, first_batch, representatives=representatives):
+        if kind == "summary":
+            payload["files_received"] = len(uploads)
+            payload["sequences"] = len(representatives)
+            payload["failed"] = unreadable + payload["failed"]
+            payload["duplicates"] = duplicates + payload["duplicates"]
+            if payload["duplicates"]:
+                payload["message"] = f"Skipped {len(payload['duplicates'])} duplicate file(s)"
+        yield kind, payload
+
+
+def _run_job(job_id, user_id, uploads, batch=process_batch):
+    """Async job body: same work as the sync endpoint, with per-image progress in the job store."""
+    summary = None
+    for kind, payload in batch(user_id, uploads):
+        if kind == "result":
+            jobs.add_result(job_id, payload)
+        else:
+            summary = {k: v for k, v in payload.items() if k != "results"}
+    return summary
+
+
+jobs.register_runner("process-images", _run_job)
+jobs.register_runner("process-sequences", partial(_run_job, batch=process_sequence_batch))
+
+
 @detection_bp.route("/process-images", methods=["POST"])
 def process_images():
     logger.info("New request to /process-images")
@@ -62,148 +361,227 @@ def process_images():
         if not (1 <= len(images) <= 32):
             return {"status": "error", "message": "Upload between 1 and 32 images"}, 400
 
-        results_list = []
-        duplicates = []
-        total_detections = 0
-        conn, cursor = get_db()
-
+        # mode=sequence: bursts / clips are stored once per event, and videos are accepted
+        sequence_mode = request.form.get("mode", "").lower() == "sequence"
+        allowed = ALLOWED_EXTENSIONS | VIDEO_EXTENSIONS if sequence_mode else ALLOWED_EXTENSIONS
+        total = 0
         for img_file in images:
-            file_bytes = img_file.read()
-            file_hash = hashlib.md5(file_bytes).hexdigest()
-
-            # Check duplicates
-            cursor.execute("SELECT COUNT(*) AS cnt FROM user_detections WHERE user_id=%s AND metadata LIKE %s",
-                           (user_id, f'%{file_hash}%'))
-            if cursor.fetchone()["cnt"] > 0:
-                duplicates.append(img_file.filename)
-                continue
-
-            filename = img_file.filename
-            ext = os.path.splitext(filename)[1].lower()
-            if ext not in ALLOWED_EXTENSIONS:
+            ext = os.path.splitext(img_file.filename)[1].lower()
+            if ext not in allowed:
                 return {"status": "error", "message": f"Unsupported file type '{ext}'"}, 400
+            # Sizes are checked before anything is read into memory (werkzeug spools big parts to disk)
+            if sequence_mode:
+                size = _upload_size(img_file)
+                total += size
+                if ext in VIDEO_EXTENSIONS and size > SEQUENCE_MAX_CLIP_MB * 1024 * 1024:
+                    return {"status": "error", "message": f"{img_file.filename} is over the "
+                                                          f"{SEQUENCE_MAX_CLIP_MB} MB video limit"}, 413
+                if total > SEQUENCE_MAX_REQUEST_MB * 1024 * 1024:
+                    return {"status": "error", "message": f"Files are over the {SEQUENCE_MAX_REQUEST_MB} MB "
+                                                          "limit per request"}, 413
+        batch = process_sequence_batch if sequence_mode else process_batch
+
+        try:
+            fields = parse_fields(request.values.get("fields"))
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}, 400
+
+        timer = StageTimer()
+        with timer.stage("read"):
+            uploads = [(img_file.filename, img_file.read()) for img_file in images]
+
+        # Opt-in async mode: queue the batch and return a job id straight away
+        if request.form.get("async", "").lower() in ("1", "true", "yes"):
+            job_id = jobs.submit("process-sequences" if sequence_mode else "process-images", user_id, uploads)
+            return jsonify({
+                "status": "queued",
+                "job_id": job_id,
+                "status_url": url_for(f"{request.blueprint}.job_status", job_id=job_id, _external=True)
+            }), 202
+
+        # Opt-in streaming: one record per image as soon as its detections are ready
+        stream = stream_format()
+        if stream:
+            return Response(stream_with_context(stream_batch(user_id, uploads, timer, fields, stream, batch)),
+                            mimetype=STREAM_MIMETYPES[stream], headers={"X-Accel-Buffering": "no"})
+
+        response = None
+        for kind, payload in batch(user_id, uploads, timer):
+            if kind == "summary":
+                response = payload
+        if fields is not None:
+            response["results"] = [select_fields(r, fields) for r in response["results"]]
+        return jsonify(response), 200
 
-            np_arr = np.frombuffer(file_bytes, np.uint8)
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-            metadata = extract_metadata(file_bytes)
-            metadata["file_hash"] = file_hash
-
-            # Run model
-            results = model.predict(frame, verbose=False)
-            boxes = results[0].boxes
-            detections = []
-
-            for box in boxes:
-                cls = int(box.cls[0]) if hasattr(box, "cls") else 0
-                conf = float(box.conf[0]) if hasattr(box, "conf") else 0.0
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                detected_class = model.names.get(cls, str(cls))
-                detections.append({
-                    "class": detected_class,
-                    "conf": round(conf, 4),
-                    "bbox": [x1, y1, x2, y2]
-                })
+    except Exception as e:
+        logger.error("Error processing images: %s", str(e), exc_info=True)
+        return {"status": "error", "message": str(e)}, 500
 
-                cursor.execute("""
-                    INSERT INTO user_detections (user_id, image_name, detected_class, confidence, bbox, metadata)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (user_id, filename, detected_class, conf, json.dumps([x1, y1, x2, y2]), json.dumps(metadata)))
-                total_detections += 1
-
-            # Save image and generate URL
-            if STORAGE_BACKEND == "local":
-                save_path = os.path.join(UPLOAD_DIR, filename)
-                cv2.imwrite(save_path, frame)
-                full_url = url_for(f"{request.blueprint}.serve_upload", filename=filename, _external=True)
-
-
-            elif STORAGE_BACKEND == "gcs" and gcs_bucket:
-                _, buffer = cv2.imencode(ext, frame)
-                blob = gcs_bucket.blob(GCS_UPLOAD_DIR + filename)
-                blob.upload_from_string(buffer.tobytes(), content_type=f"image/{ext.strip('.')}")
-                full_url = blob.generate_signed_url(
-                                                        version="v4",
-                                                        expiration=timedelta(days=7),  
-                                                        method="GET"
-                                                    )
-                
-                print("✅ Uploaded to GCS. Temporary URL:", full_url)
-
-
-            results_list.append({
-                "image_name": filename,
-                "image_url": full_url,  #  full browser-accessible URL
-                "timestamp": datetime.utcnow().isoformat(),
-                "objects": detections,
-                "metadata": metadata
-            })
 
-        conn.commit()
-        conn.close()
+def _upload_size(file_storage):
+    stream = file_storage.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
 
-        response = {
-            "status": "success",
-            "user_id": user_id,
-            "images_processed": len(results_list),
-            "total_detections": total_detections,
-            "duplicates": duplicates,
-            "results": results_list
-        }
-        if duplicates:
-            response["message"] = f"Skipped {len(duplicates)} duplicate file(s)"
 
-        return jsonify(response), 200
+# ---------------- Streaming (NDJSON / SSE) ---------------- #
+STREAM_MIMETYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def stream_format():
+    """'ndjson' / 'sse' from ?stream= or the Accept header; None for a normal JSON response."""
+    value = request.values.get("stream", "").lower()
+    if value in ("1", "true", "yes", "ndjson"):
+        return "ndjson"
+    if value == "sse":
+        return "sse"
+    accept = request.accept_mimetypes
+    if accept.best in STREAM_MIMETYPES.values():
+        return "ndjson" if accept.best == STREAM_MIMETYPES["ndjson"] else "sse"
+    return None
+
+
+def _record(kind, payload, fmt):
+    if fmt == "sse":
+        return f"event: {kind}\ndata: {json.dumps(payload, default=str)}\n\n"
+    return json.dumps({"type": kind, **payload}, default=str) + "\n"
 
+
+def stream_batch(user_id, uploads, timer, fields, fmt, batch=process_batch):
+    """
+    process_batch as a stream: a "result" record per image (first one after a single
+    image's inference), then the "summary" without the repeated results. Rows are
+    committed before the summary; a failure after results were sent ends with an
+    "error" record instead.
+    """
+    try:
+        for kind, payload in batch(user_id, uploads, timer, first_batch=1):
+            if kind == "result":
+                yield _record("result", select_fields(payload, fields), fmt)
+            else:
+                yield _record("summary", {k: v for k, v in payload.items() if k != "results"}, fmt)
     except Exception as e:
-        logger.error("Error processing images: %s", str(e), exc_info=True)
-        return {"status": "error", "message": str(e)}, 500
+        logger.error("Error streaming batch results: %s", str(e), exc_info=True)
+        yield _record("error", {"status": "error", "message": str(e)}, fmt)
+
+
+# ---------------- Async job status ---------------- #
+@detection_bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job), 200
 
 # ---------------- User Tagged Images ---------------- #
 
 
 
+def _encode_cursor(created_at, image_id):
+    raw = f"{created_at.isoformat()}|{image_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    created_at, image_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(created_at), int(image_id)
+
+
 @detection_bp.route("/user/<user_id>/tagged-images", methods=["GET"])
 def user_tagged_images(user_id):
+    """
+    Images with detections, newest first, paged by image with an opaque cursor on
+    (created_at, id). Pass the returned next_cursor to get the following page.
+    """
+    if request.args.get("page"):
+        return jsonify({"status": "error", "message": "page is no longer supported, "
+                                                      "pass the previous response's next_cursor as cursor"}), 400
     try:
-        page, limit = int(request.args.get("page", 1)), int(request.args.get("limit", 50))
-        cls, offset = request.args.get("class"), (page - 1) * limit
+        limit = max(1, min(int(request.args.get("limit", 50)), 200))
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit must be an integer"}), 400
+
+    try:
+        cls = request.args.get("class")
+        camera = request.args.get("camera")
+        try:
+            after = _decode_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({"status": "error", "message": "Invalid cursor"}), 400
 
         conn, cur = get_db()
-        query = "SELECT image_name, detected_class, confidence, bbox, timestamp FROM user_detections WHERE user_id=%s"
+        query = """SELECT i.id, i.image_name, i.storage_key, i.camera, i.captured_at, i.created_at
+                   FROM user_images i WHERE i.user_id=%s"""
         params = [user_id]
+        if camera:
+            query += " AND i.camera = %s"
+            params.append(camera)
         if cls:
-            query += " AND detected_class=%s"
+            query += """ AND EXISTS (SELECT 1 FROM user_detections d
+                                     WHERE d.image_id = i.id AND d.detected_class = %s)"""
             params.append(cls)
-        query += " ORDER BY timestamp DESC LIMIT %s OFFSET %s"
-        params += [limit, offset]
-
-        cur.execute(query, params)
-        rows = cur.fetchall()
+        else:
+            query += " AND i.detection_count > 0"
+        if after:
+            query += " AND (i.created_at < %s OR (i.created_at = %s AND i.id < %s))"
+            params += [after[0], after[0], after[1]]
+        query += " ORDER BY i.created_at DESC, i.id DESC LIMIT %s"
+        params.append(limit + 1)  # one extra row tells us whether there is a next page
+
+        with metrics.timer(metrics.QUERY_SECONDS, "tagged_images_page"):
+            cur.execute(query, params)
+            image_rows = cur.fetchall()
+        has_more = len(image_rows) > limit
+        image_rows = image_rows[:limit]
+
+        # One URL resolution per page: signed URLs come from the cache, only misses are signed
+        keys = [r["storage_key"] or r["image_name"] for r in image_rows]
+        full_urls, thumb_urls = urls.image_urls(keys), urls.image_urls(keys, size="thumb")
+
+        images = {}  # user_images.id -> entry; the same filename can be two different uploads
+        for r, key in zip(image_rows, keys):
+            images[r["id"]] = {
+                "image_id": r["id"],
+                "image_name": r["image_name"],
+                "image_url": full_urls[key],
+                "thumbnail_url": thumb_urls[key],
+                "timestamp": r["created_at"].isoformat() if r["created_at"] else None,
+                "camera": r["camera"],
+                "captured_at": r["captured_at"].isoformat() if r["captured_at"] else None,
+                "detections": []
+            }
+
+        if images:
+            placeholders = ", ".join(["%s"] * len(images))
+            query = f"""SELECT id, image_id, detected_class, confidence, bbox FROM user_detections
+                        WHERE user_id=%s AND image_id IN ({placeholders})"""
+            params = [user_id] + list(images)
+            if cls:
+                query += " AND detected_class=%s"
+                params.append(cls)
+            with metrics.timer(metrics.QUERY_SECONDS, "tagged_images_detections"):
+                cur.execute(query, params)
+                detection_rows = cur.fetchall()
+            for r in detection_rows:
+                images[r["image_id"]]["detections"].append({
+                    "id": r["id"],
+                    "class": r["detected_class"],
+                    "confidence": float(r["confidence"]),
+                    "bbox": json.loads(r["bbox"]) if r["bbox"] else None
+                })
         cur.close()
         conn.close()
 
-        images = {}
-        for r in rows:
-            n = r["image_name"]
-            if n not in images:
-                images[n] = {
-                        "image_name": n,
-                        "image_url": url_for(".serve_upload", filename=n, _external=True),
-                        "timestamp": r["timestamp"].isoformat() if r["timestamp"] else None,
-                        "detections": []
-                    }
-
-            images[n]["detections"].append({
-                "class": r["detected_class"],
-                "confidence": float(r["confidence"]),
-                "bbox": json.loads(r["bbox"]) if r["bbox"] else None
-            })
-
+        last = image_rows[-1] if image_rows else None
         return jsonify({
             "user_id": user_id,
-            "page": page,
             "limit": limit,
-            "images": list(images.values())
+            "images": list(images.values()),
+            "next_cursor": _encode_cursor(last["created_at"], last["id"]) if has_more else None
         }), 200
 
     except Exception as e:
@@ -213,25 +591,75 @@ def user_tagged_images(user_id):
 
 
 
+# ---------------- Export ---------------- #
+@detection_bp.route("/user/<user_id>/export", methods=["GET"])
+def export_detections(user_id):
+    """
+    Every detection of the user as a download, one row each: ?format=csv|ndjson|parquet,
+    optional start / end (ISO date or datetime, on capture time), class and camera.
+    Streamed straight from the database cursor, so any size works.
+    """
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in export.available_formats():
+        return jsonify({"status": "error", "message": f"format must be one of {export.available_formats()}"}), 400
+    try:
+        start = export.parse_date(request.args.get("start"))
+        end = export.parse_date(request.args.get("end"), end=True)
+    except ValueError:
+        return jsonify({"status": "error", "message": "start / end must be ISO dates"}), 400
+
+    query, params = export.build_query(user_id, start, end, request.args.get("class"), request.args.get("camera"))
+
+    # The first chunk is pulled before any headers go out, so a failed query or a pool
+    # timeout is still a 500 rather than an empty download
+    body = export.ENCODERS[fmt](export.iter_rows(query, params))
+    try:
+        first = next(body, None)
+    except Exception as e:
+        logger.error(f"Export for user {user_id} failed: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    def generate():
+        if first is not None:
+            yield first
+        try:
+            yield from body
+        except Exception as e:
+            # Headers are gone by now: re-raise so the server drops the connection and the
+            # client sees an incomplete transfer instead of a cleanly ended, truncated file
+            logger.error(f"Export for user {user_id} failed: {e}", exc_info=True)
+            raise
+
+    filename = f"detections-{user_id}-{datetime.utcnow():%Y%m%d}.{fmt}"
+    return Response(stream_with_context(generate()), mimetype=export.FORMATS[fmt],
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                             "X-Accel-Buffering": "no"})
+
+
 # ---------------- Update detection class/bbox ---------------- #
 @detection_bp.route("/user/<user_id>/update-detection", methods=["PATCH"])
 def update_detection(user_id):
     try:
         data = request.get_json()
         image_name = data.get("image_name")
+        image_id = data.get("image_id")
         detections = data.get("detections", [])
 
-        if not image_name or not detections:
-            return jsonify({"status": "error", "message": "image_name and detections required"}), 400
+        if not (image_name or image_id) or not detections:
+            return jsonify({"status": "error", "message": "image_id (or image_name) and detections required"}), 400
 
         conn, cur = get_db()
 
-        # Check if image exists
-        cur.execute("SELECT COUNT(*) AS cnt FROM user_detections WHERE user_id=%s AND image_name=%s",
-                    (user_id, image_name))
-        if cur.fetchone()["cnt"] == 0:
+        # Check if image exists (and where its counts live in the rollup)
+        found = find_image(cur, user_id, image_name, image_id)
+        if found is None or found == AMBIGUOUS:
             cur.close(); conn.close()
-            return jsonify({"status": "error", "message": "Image not found"}), 404
+            if found is None:
+                return jsonify({"status": "error", "message": "Image not found"}), 404
+            return jsonify({"status": "error", "message": f"More than one image is named {image_name}, "
+                                                          "pass image_id"}), 409
+        image_id, camera, day = found
+        rollup = RollupDelta()
 
         # Update detections
         for det in detections:
@@ -242,45 +670,316 @@ def update_detection(user_id):
             cur.execute("""
                 UPDATE user_detections
                 SET detected_class=%s, bbox=%s
-                WHERE user_id=%s AND image_name=%s AND detected_class=%s
-            """, (new_cls, json.dumps(bbox), user_id, image_name, old_cls))
+                WHERE user_id=%s AND image_id=%s AND detected_class=%s
+            """, (new_cls, json.dumps(bbox), user_id, image_id, old_cls))
+            if new_cls != old_cls and cur.rowcount > 0:
+                rollup.detection(user_id, old_cls, camera, day, -cur.rowcount)
+                rollup.detection(user_id, new_cls, camera, day, cur.rowcount)
 
+        rollup.apply(cur)
         conn.commit()
         cur.close(); conn.close()
+        invalidate_rollup([user_id])
         return jsonify({"status": "success", "message": "Detections updated"}), 200
 
     except Exception as e:
         logger.error(f"Error updating detection: {e}", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
-# ---------------- Delete image ---------------- #
+# ---------------- Delete images ---------------- #
+def _delete_images(conn, cur, user_id, image_names=(), image_ids=()):
+    """
+    Delete images, by name or by id, with their detections and rollup counts in one
+    transaction, using set-based statements. A name shared by several uploads is left
+    alone. Returns ({id: name} of the deleted images, ambiguous names); stored objects
+    nothing references any more are removed in the background.
+    """
+    clauses, params = [], [user_id]
+    if image_names:
+        clauses.append(f"image_name IN ({', '.join(['%s'] * len(image_names))})")
+        params += list(image_names)
+    if image_ids:
+        clauses.append(f"id IN ({', '.join(['%s'] * len(image_ids))})")
+        params += list(image_ids)
+    if not clauses:
+        return {}, set()
+    cur.execute(f"""
+        SELECT id, image_name, camera, DATE(created_at) AS day, COALESCE(storage_key, image_name) AS storage_key,
+               clip_key
+        FROM user_images WHERE user_id=%s AND ({" OR ".join(clauses)})
+    """, params)
+    rows = cur.fetchall()
+    named = {}
+    for r in rows:
+        named[r["image_name"]] = named.get(r["image_name"], 0) + 1
+    ambiguous = {n for n in image_names if named.get(n, 0) > 1}
+    ids = set(image_ids)
+    images = [r for r in rows
+              if r["id"] in ids or (r["image_name"] in image_names and r["image_name"] not in ambiguous)]
+    if not images:
+        return {}, ambiguous
+    found = sorted(r["id"] for r in images)
+    placeholders = ", ".join(["%s"] * len(found))
+    params = [user_id] + found
+
+    # Take the images' counts back out of the dashboard rollup
+    rollup = RollupDelta()
+    where = {}
+    for r in images:
+        where[r["id"]] = ((r["camera"] or "")[:255], r["day"])
+        rollup.image(user_id, where[r["id"]][0], r["day"], -1)
+    cur.execute(f"""
+        SELECT image_id, detected_class, COUNT(*) AS cnt FROM user_detections
+        WHERE user_id=%s AND image_id IN ({placeholders}) GROUP BY image_id, detected_class
+    """, params)
+    for row in cur.fetchall():
+        camera, day = where[row["image_id"]]
+        rollup.detection(user_id, row["detected_class"], camera, day, -row["cnt"])
+
+    cur.execute(f"DELETE FROM user_detections WHERE user_id=%s AND image_id IN ({placeholders})", params)
+    cur.execute(f"DELETE FROM user_image_sources WHERE user_id=%s AND image_id IN ({placeholders})", params)
+    cur.execute(f"DELETE FROM user_images WHERE user_id=%s AND id IN ({placeholders})", params)
+    rollup.apply(cur)
+
+    # Objects are shared by content, only remove ones nobody else references. The check
+    # locks the keys' index range, so an upload inserting the same key waits for our
+    # commit; one that found the object still in storage puts it back once its row is
+    # in (process_batch). Deletes run in the background, after the commit.
+    orphaned = _unreferenced(cur, "storage_key", {r["storage_key"] for r in images})
+    orphaned_clips = _unreferenced(cur, "clip_key", {r["clip_key"] for r in images if r["clip_key"]})
+    conn.commit()
+    invalidate_rollup([user_id])
+    for key in orphaned + orphaned_clips:
+        delete_async(key)
+    for key in orphaned:
+        thumbnails.discard_async(key)
+    return {r["id"]: r["image_name"] for r in images}, ambiguous
+
+
+def _unreferenced(cur, column, keys):
+    """Keys no user_images row points at any more (column: storage_key or clip_key), read with locks."""
+    keys = sorted(keys)
+    if not keys:
+        return []
+    placeholders = ", ".join(["%s"] * len(keys))
+    cur.execute(f"SELECT DISTINCT {column} FROM user_images WHERE {column} IN ({placeholders}) FOR UPDATE", keys)
+    referenced = {row[column] for row in cur.fetchall()}
+    return [key for key in keys if key not in referenced]
+
+
 @detection_bp.route("/user/<user_id>/delete-image", methods=["DELETE"])
 def delete_image(user_id):
     data = request.get_json()
     image_name = data.get("image_name")
-    if not image_name:
-        return jsonify({"status": "error", "message": "image_name is required"}), 400
+    image_id = data.get("image_id")
+    if not (image_name or image_id):
+        return jsonify({"status": "error", "message": "image_id or image_name is required"}), 400
+    if image_id is not None and not _is_id(image_id):
+        return jsonify({"status": "error", "message": "image_id must be an integer"}), 400
 
     try:
         conn, cur = get_db(buffered=True)  # <-- buffered cursor
-        # Check if image exists
-        cur.execute("SELECT id FROM user_detections WHERE user_id=%s AND image_name=%s", (user_id, image_name))
-        if not cur.fetchone():
+        try:
+            if image_id is not None:
+                deleted, ambiguous = _delete_images(conn, cur, user_id, image_ids=[image_id])
+            else:
+                deleted, ambiguous = _delete_images(conn, cur, user_id, image_names=[image_name])
+        finally:
             cur.close(); conn.close()
+        if ambiguous:
+            return jsonify({"status": "error", "message": f"More than one image is named {image_name}, "
+                                                          "pass image_id"}), 409
+        if not deleted:
             return jsonify({"status": "error", "message": "Image not found"}), 404
+        return jsonify({"status": "success", "message": f"{deleted[min(deleted)]} deleted"}), 200
 
-        # Delete all records for that image
-        cur.execute("DELETE FROM user_detections WHERE user_id=%s AND image_name=%s", (user_id, image_name))
-        conn.commit()
-        cur.close(); conn.close()
+    except Exception as e:
+        logger.error(f"Error deleting image {image_id or image_name}: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-        # Optionally delete file if local storage
-        file_path = os.path.join(UPLOAD_DIR, image_name)
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
-        return jsonify({"status": "success", "message": f"{image_name} deleted"}), 200
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def _is_bbox(value):
+    return (isinstance(value, list) and len(value) == 4
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value))
+
+
+def _bulk_items(data, field):
+    """The list under `field` of a bulk request body, or an error response."""
+    items = (data or {}).get(field)
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({"status": "error", "message": f"{field} must be a non-empty list"}), 400)
+    if len(items) > BULK_MAX_ITEMS:
+        return None, (jsonify({"status": "error", "message": f"At most {BULK_MAX_ITEMS} {field} per request"}), 400)
+    return items, None
+
+
+@detection_bp.route("/user/<user_id>/images/bulk-delete", methods=["POST"])
+def bulk_delete_images(user_id):
+    """
+    Body: {"image_ids": [...]} or {"image_names": [...]}. One transaction; per-image
+    status in the response. A name shared by several uploads is reported as ambiguous.
+    """
+    data = request.get_json(silent=True)
+    by_id = isinstance(data, dict) and "image_ids" in data
+    field, valid = ("image_ids", _is_id) if by_id else ("image_names", lambda n: isinstance(n, str) and n)
+    items, error = _bulk_items(data, field)
+    if error:
+        return error
+    wanted = list(dict.fromkeys(i for i in items if valid(i)))
+
+    try:
+        deleted, ambiguous = {}, set()
+        if wanted:
+            conn, cur = get_db(buffered=True)
+            try:
+                if by_id:
+                    deleted, ambiguous = _delete_images(conn, cur, user_id, image_ids=wanted)
+                else:
+                    deleted, ambiguous = _delete_images(conn, cur, user_id, image_names=wanted)
+            finally:
+                cur.close(); conn.close()
+
+        done = set(deleted) if by_id else set(deleted.values())
+        key = field[:-1]
+        results = [{key: i, "status": "deleted" if i in done else "ambiguous" if i in ambiguous else "not_found"}
+                   for i in wanted]
+        results += [{key: i, "status": "invalid"} for i in items if not valid(i)]
+        return jsonify({"status": "success", "user_id": user_id, "deleted": len(deleted), "results": results}), 200
+
+    except Exception as e:
+        logger.error(f"Error bulk deleting images for user {user_id}: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+# ---------------- Batch URL resolution ---------------- #
+@detection_bp.route("/user/<user_id>/image-urls", methods=["POST"])
+def user_image_urls(user_id):
+    """
+    Body: {"image_names": [...], "size": optional THUMBNAIL_SIZES name}. URLs for many of
+    the user's images in one call (signed in GCS mode, reused from cache when possible).
+    """
+    data = request.get_json(silent=True) or {}
+    image_names, error = _bulk_items(data, "image_names")
+    if error:
+        return error
+    size = data.get("size")
+    if size is not None:
+        try:
+            thumbnails.parse_width({"size": size})
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        names = list(dict.fromkeys(n for n in image_names if isinstance(n, str)))
+        keys = {}
+        if names:
+            conn, cur = get_db()
+            try:
+                placeholders = ", ".join(["%s"] * len(names))
+                cur.execute(f"SELECT image_name, COALESCE(storage_key, image_name) AS storage_key FROM user_images "
+                            f"WHERE user_id=%s AND image_name IN ({placeholders})", [user_id] + names)
+                keys = {r["image_name"]: r["storage_key"] for r in cur.fetchall()}
+            finally:
+                cur.close(); conn.close()
+
+        resolved = urls.image_urls(list(keys.values()), size=size)
+        return jsonify({
+            "status": "success",
+            "user_id": user_id,
+            "urls": {name: resolved[key] for name, key in keys.items()},
+            "not_found": [n for n in names if n not in keys]
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error resolving image URLs for user {user_id}: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+# ---------------- Bulk update detections ---------------- #
+@detection_bp.route("/user/<user_id>/detections/bulk-update", methods=["POST"])
+def bulk_update_detections(user_id):
+    """
+    Body: {"updates": [{"id": <detection id>, "class": ..., "bbox": [x1, y1, x2, y2]}, ...]};
+    class and bbox are each optional. Applied with one UPDATE in one transaction.
+    Results follow the request order; for a repeated id the last update wins and the
+    earlier ones are reported as superseded.
+    """
+    updates, error = _bulk_items(request.get_json(silent=True), "updates")
+    if error:
+        return error
+
+    results = [None] * len(updates)
+    changes = {}  # detection id -> (index, item)
+    for index, item in enumerate(updates):
+        det_id = item.get("id") if isinstance(item, dict) else None
+        if (not _is_id(det_id) or not ("class" in item or "bbox" in item)
+                or ("class" in item and not (isinstance(item["class"], str) and item["class"]))
+                or ("bbox" in item and not _is_bbox(item["bbox"]))):
+            results[index] = {"id": det_id, "status": "invalid"}
+            continue
+        if det_id in changes:
+            results[changes[det_id][0]] = {"id": det_id, "status": "superseded"}
+        changes[det_id] = (index, item)
+
+    try:
+        if changes:
+            conn, cur = get_db()
+            try:
+                ids = list(changes)
+                placeholders = ", ".join(["%s"] * len(ids))
+                cur.execute(f"""
+                    SELECT d.id, d.detected_class, i.camera, DATE(i.created_at) AS day
+                    FROM user_detections d
+                    JOIN user_images i ON i.id = d.image_id
+                    WHERE d.user_id=%s AND d.id IN ({placeholders})
+                """, [user_id] + ids)
+                current = {r["id"]: r for r in cur.fetchall()}
+
+                rollup = RollupDelta()
+                class_case, bbox_case, params_cls, params_bbox = [], [], [], []
+                for det_id in ids:
+                    index, item = changes[det_id]
+                    if det_id not in current:
+                        results[index] = {"id": det_id, "status": "not_found"}
+                        continue
+                    row = current[det_id]
+                    if "class" in item and item["class"] != row["detected_class"]:
+                        class_case.append("WHEN %s THEN %s")
+                        params_cls += [det_id, item["class"]]
+                        camera, day = (row["camera"] or "")[:255], row["day"]
+                        rollup.detection(user_id, row["detected_class"], camera, day, -1)
+                        rollup.detection(user_id, item["class"], camera, day, 1)
+                    if "bbox" in item:
+                        bbox_case.append("WHEN %s THEN %s")
+                        params_bbox += [det_id, json.dumps(item["bbox"])]
+                    results[index] = {"id": det_id, "status": "updated"}
+
+                # One statement for every row: CASE on the id picks each row's new values
+                found = [i for i in ids if i in current]
+                if class_case or bbox_case:
+                    sets, params = [], []
+                    if class_case:
+                        sets.append(f"detected_class = CASE id {' '.join(class_case)} ELSE detected_class END")
+                        params += params_cls
+                    if bbox_case:
+                        sets.append(f"bbox = CASE id {' '.join(bbox_case)} ELSE bbox END")
+                        params += params_bbox
+                    placeholders = ", ".join(["%s"] * len(found))
+                    cur.execute(f"UPDATE user_detections SET {', '.join(sets)} "
+                                f"WHERE user_id=%s AND id IN ({placeholders})", params + [user_id] + found)
+                rollup.apply(cur)
+                conn.commit()
+            finally:
+                cur.close(); conn.close()
+            invalidate_rollup([user_id])
+
+        updated = sum(1 for r in results if r["status"] == "updated")
+        return jsonify({"status": "success", "user_id": user_id, "updated": updated, "results": results}), 200
 
     except Exception as e:
-        logger.error(f"Error deleting image {image_name}: {e}", exc_info=True)
+        logger.error(f"Error bulk updating detections for user {user_id}: {e}", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
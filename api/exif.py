@@ -0,0 +1,203 @@
+"""
+Minimal EXIF reader for the fields we store. Parses the APP1 TIFF structure
+directly from the upload bytes (no image open, no MakerNote walk) and returns a
+small typed record instead of every tag stringified.
+"""
+import re
+import struct
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from .config import logger
+from .utils import scan_jpeg
+
+MAX_TEXT = 64  # every stored string is capped, so a record stays a few hundred bytes
+MAX_ENTRIES = 256  # per IFD; anything bigger is corrupt
+
+# Tag ids (IFD0 / Exif IFD / GPS IFD)
+MAKE, MODEL, ORIENTATION, DESCRIPTION, DATETIME = 0x010F, 0x0110, 0x0112, 0x010E, 0x0132
+EXIF_IFD, GPS_IFD = 0x8769, 0x8825
+DATETIME_ORIGINAL, USER_COMMENT, AMBIENT_TEMPERATURE = 0x9003, 0x9286, 0x9400
+GPS_LAT_REF, GPS_LAT, GPS_LON_REF, GPS_LON, GPS_ALT_REF, GPS_ALT = 1, 2, 3, 4, 5, 6
+
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+# Trail cams (Browning, Bushnell, Stealth Cam, ...) stamp these into the description/comment text
+TEMPERATURE_TEXT = re.compile(r"(-?\d{1,3})\s*°?\s*([CF])\b", re.IGNORECASE)
+MOON_PHASES = ("new moon", "waxing crescent", "first quarter", "waxing gibbous", "full moon",
+               "waning gibbous", "last quarter", "third quarter", "waning crescent")
+
+
+class ExifRecord(NamedTuple):
+    camera: Optional[str] = None
+    captured_at: Optional[datetime] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    altitude: Optional[float] = None
+    temperature_c: Optional[float] = None
+    moon_phase: Optional[str] = None
+    orientation: Optional[int] = None
+
+    def as_dict(self):
+        """JSON-ready, without empty fields."""
+        out = {}
+        for name, value in self._asdict().items():
+            if value is None:
+                continue
+            out[name] = value.isoformat() if isinstance(value, datetime) else value
+        return out
+
+
+# ---------------- TIFF parsing ---------------- #
+class _Tiff:
+    def __init__(self, data):
+        if data[:2] == b"II":
+            self.order = "<"
+        elif data[:2] == b"MM":
+            self.order = ">"
+        else:
+            raise ValueError("not a TIFF header")
+        self.data = data
+
+    def unpack(self, fmt, offset):
+        return struct.unpack_from(self.order + fmt, self.data, offset)
+
+    def ifd(self, offset):
+        """{tag: (type, count, value_offset)} for one IFD."""
+        entries = {}
+        count = self.unpack("H", offset)[0]
+        if count > MAX_ENTRIES:
+            raise ValueError("IFD too large")
+        for i in range(count):
+            pos = offset + 2 + i * 12
+            tag, typ, n = self.unpack("HHI", pos)
+            size = TYPE_SIZES.get(typ, 1) * n
+            value_offset = pos + 8 if size <= 4 else self.unpack("I", pos + 8)[0]
+            entries[tag] = (typ, n, value_offset)
+        return entries
+
+    def raw(self, entry, limit=256):
+        _, n, offset = entry
+        return self.data[offset:offset + min(n, limit)]
+
+    def value(self, entry):
+        typ, n, offset = entry
+        if typ in (2, 7):  # ASCII / UNDEFINED
+            return self.raw(entry).split(b"\x00", 1)[0].decode("latin-1").strip()
+        if typ == 3:
+            values = self.unpack(f"{n}H", offset)
+        elif typ == 4:
+            values = self.unpack(f"{n}I", offset)
+        elif typ in (5, 10):
+            raw = self.unpack(f"{2 * n}{'I' if typ == 5 else 'i'}", offset)
+            values = tuple(a / b if b else 0.0 for a, b in zip(raw[::2], raw[1::2]))
+        elif typ == 1:
+            values = tuple(self.data[offset:offset + n])
+        else:
+            return None
+        return values[0] if n == 1 else values
+
+
+def _text(tiff, entries, tag):
+    if tag not in entries:
+        return None
+    value = tiff.value(entries[tag])
+    return value[:MAX_TEXT] if isinstance(value, str) and value else None
+
+
+def _datetime(text):
+    try:
+        return datetime.strptime(text[:19], "%Y:%m:%d %H:%M:%S") if text else None
+    except ValueError:
+        return None
+
+
+def _degrees(tiff, entries, value_tag, ref_tag):
+    if value_tag not in entries:
+        return None
+    d, m, s = tiff.value(entries[value_tag])
+    ref = _text(tiff, entries, ref_tag) or ""
+    degrees = d + m / 60 + s / 3600
+    return round(-degrees if ref.upper() in ("S", "W") else degrees, 6)
+
+
+def _user_comment(tiff, entry):
+    """UserComment: an 8-byte charset prefix ("ASCII\\0\\0\\0", "UNICODE\\0", ...) then the text."""
+    raw = tiff.raw(entry, limit=8 + 512)
+    prefix, body = raw[:8], raw[8:]
+    if prefix == b"UNICODE\x00":
+        text = body.decode("utf-16-le" if tiff.order == "<" else "utf-16-be", errors="replace")
+    elif prefix in (b"ASCII\x00\x00\x00", b"\x00" * 8) or prefix.startswith(b"JIS"):
+        text = body.decode("latin-1")
+    else:
+        text = raw.decode("latin-1")  # no prefix at all
+    return text.split("\x00", 1)[0].strip() or None
+
+
+def _vendor_text(texts):
+    """Temperature (as Celsius) and moon phase from the free-text fields trail cams fill in."""
+    temperature = moon = None
+    for text in texts:
+        if not text:
+            continue
+        lowered = text.lower()
+        if moon is None:
+            moon = next((p for p in MOON_PHASES if p in lowered), None)
+        if temperature is None:
+            match = TEMPERATURE_TEXT.search(text)
+            if match:
+                value = float(match.group(1))
+                temperature = round((value - 32) * 5 / 9, 1) if match.group(2).upper() == "F" else value
+    return temperature, moon
+
+
+def parse_exif(payload):
+    """ExifRecord from an APP1 payload (the bytes after 'Exif\\0\\0')."""
+    tiff = _Tiff(payload)
+    ifd0 = tiff.ifd(tiff.unpack("I", 4)[0])
+    exif = tiff.ifd(tiff.value(ifd0[EXIF_IFD])) if EXIF_IFD in ifd0 else {}
+    gps = tiff.ifd(tiff.value(ifd0[GPS_IFD])) if GPS_IFD in ifd0 else {}
+
+    make, model = _text(tiff, ifd0, MAKE), _text(tiff, ifd0, MODEL)
+    if make and model and model.lower().startswith(make.lower()):
+        make = None  # "Canon" + "Canon EOS R5"
+    camera = " ".join(p for p in (make, model) if p) or None
+
+    comment = _user_comment(tiff, exif[USER_COMMENT]) if USER_COMMENT in exif else None
+    temperature, moon = _vendor_text([_text(tiff, ifd0, DESCRIPTION), comment])
+    if AMBIENT_TEMPERATURE in exif:
+        temperature = round(float(tiff.value(exif[AMBIENT_TEMPERATURE])), 1)
+
+    altitude = None
+    if GPS_ALT in gps:
+        altitude = round(float(tiff.value(gps[GPS_ALT])), 1)
+        if GPS_ALT_REF in gps and tiff.value(gps[GPS_ALT_REF]) == 1:
+            altitude = -altitude
+
+    orientation = tiff.value(ifd0[ORIENTATION]) if ORIENTATION in ifd0 else None
+    return ExifRecord(
+        camera=camera[:MAX_TEXT] if camera else None,
+        captured_at=_datetime(_text(tiff, exif, DATETIME_ORIGINAL) or _text(tiff, ifd0, DATETIME)),
+        latitude=_degrees(tiff, gps, GPS_LAT, GPS_LAT_REF),
+        longitude=_degrees(tiff, gps, GPS_LON, GPS_LON_REF),
+        altitude=altitude,
+        temperature_c=temperature,
+        moon_phase=moon[:MAX_TEXT] if moon else None,
+        orientation=orientation if isinstance(orientation, int) else None,
+    )
+
+
+def read_exif(file_bytes, payload=None):
+    """
+    ExifRecord for an upload; empty if it has no (readable) EXIF. Pass the APP1
+    payload from utils.scan_jpeg when the headers were already scanned.
+    """
+    if payload is None:
+        payload = scan_jpeg(file_bytes)[1]
+    if not payload:
+        return ExifRecord()
+    try:
+        return parse_exif(payload)
+    except (ValueError, struct.error, TypeError, IndexError) as e:
+        logger.warning("No metadata extracted: %s", e)
+        return ExifRecord()
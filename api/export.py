@@ -0,0 +1,167 @@
+"""
+Full exports of a user's detections, one row per detection. Rows come off an
+unbuffered server-side cursor EXPORT_CHUNK_ROWS at a time and are encoded as they
+arrive, so memory stays flat whatever the row count. Parquet needs pyarrow; rows are
+written as row groups of EXPORT_PARQUET_ROW_GROUP and each group is sent when done.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from . import db, metrics
+from .config import EXPORT_CHUNK_ROWS, EXPORT_PARQUET_ROW_GROUP
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+COLUMNS = ("detection_id", "image_name", "camera", "captured_at", "uploaded_at",
+           "class", "confidence", "x1", "y1", "x2", "y2")
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+
+def available_formats():
+    return [f for f in FORMATS if f != "parquet" or pa is not None]
+
+
+def parse_date(value, end=False):
+    """ISO date or datetime; a bare end date covers that whole day."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def build_query(user_id, start=None, end=None, cls=None, camera=None):
+    # Capture time where EXIF had one, upload time otherwise
+    query = """SELECT d.id, d.image_name, i.camera, i.captured_at, i.created_at,
+                      d.detected_class, d.confidence, d.bbox
+               FROM user_detections d
+               JOIN user_images i ON i.id = d.image_id
+               WHERE d.user_id = %s"""
+    params = [user_id]
+    if start:
+        query += " AND COALESCE(i.captured_at, i.created_at) >= %s"
+        params.append(start)
+    if end:
+        query += " AND COALESCE(i.captured_at, i.created_at) < %s"
+        params.append(end)
+    if cls:
+        query += " AND d.detected_class = %s"
+        params.append(cls)
+    if camera:
+        query += " AND i.camera = %s"
+        params.append(camera)
+    query += " ORDER BY COALESCE(i.captured_at, i.created_at), d.id"
+    return query, params
+
+
+def _row(r):
+    bbox = json.loads(r[7]) if r[7] else None
+    x1, y1, x2, y2 = bbox if bbox and len(bbox) == 4 else (None,) * 4
+    return (r[0], r[1], r[2], r[3].isoformat() if r[3] else None, r[4].isoformat() if r[4] else None,
+            r[5], float(r[6]) if r[6] is not None else None, x1, y1, x2, y2)
+
+
+def iter_rows(query, params):
+    """Chunks of export rows. Holds one connection from the 'export' pool until exhausted."""
+    conn, cur = db.get_db("export", dictionary=False, buffered=False)
+    exhausted = False
+    try:
+        with metrics.timer(metrics.QUERY_SECONDS, "export_open"):
+            cur.execute(query, params)
+        while True:
+            chunk = cur.fetchmany(EXPORT_CHUNK_ROWS)
+            if not chunk:
+                break
+            yield [_row(r) for r in chunk]
+        exhausted = True
+    finally:
+        if exhausted:
+            cur.close()
+            conn.close()
+        else:
+            # Abandoned mid-result (client went away, or an error): closing the cursor or
+            # rolling back would read every remaining row first, so drop the connection
+            conn.discard()
+
+
+# ---------------- Encoders ---------------- #
+def encode_csv(chunks):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(COLUMNS)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    if out.tell():
+        yield out.getvalue()
+
+
+def encode_ndjson(chunks):
+    for chunk in chunks:
+        yield "".join(json.dumps(dict(zip(COLUMNS, row))) + "\n" for row in chunk)
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands back whatever the Parquet writer has produced so far."""
+
+    def __init__(self):
+        self._parts, self._pos = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def _parquet_schema():
+    return pa.schema([
+        ("detection_id", pa.int64()), ("image_name", pa.string()), ("camera", pa.string()),
+        ("captured_at", pa.string()), ("uploaded_at", pa.string()), ("class", pa.string()),
+        ("confidence", pa.float64()), ("x1", pa.float64()), ("y1", pa.float64()), ("x2", pa.float64()),
+        ("y2", pa.float64()),
+    ])
+
+
+def encode_parquet(chunks):
+    schema = _parquet_schema()
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    group = []
+
+    def write_group():
+        columns = list(zip(*group))
+        writer.write_table(pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(columns, schema)],
+                                                schema=schema))
+        group.clear()
+
+    for chunk in chunks:
+        group.extend(chunk)
+        if len(group) >= EXPORT_PARQUET_ROW_GROUP:
+            write_group()
+            yield sink.drain()
+    if group:
+        write_group()
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson, "parquet": encode_parquet}
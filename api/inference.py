@@ -0,0 +1,162 @@
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from .config import (
+    logger, get_model, MODEL_PATH, MODEL_IMGSZ, MODEL_MAX_BATCH, MODEL_DYNAMIC, INFERENCE_BATCH_SIZE,
+    INFERENCE_SERVER_ADDRESS, OV_DEVICE, OV_PERFORMANCE_HINT, OV_NUM_THREADS, OV_NUM_STREAMS,
+    OV_PRECISION_HINT, MODEL_WARMUP_RUNS
+)
+
+# With these hints ultralytics' OpenVINO backend runs each frame of a batch as its own
+# async infer request, so a static batch-1 export can still take multi-frame batches.
+ASYNC_HINTS = {"THROUGHPUT", "CUMULATIVE_THROUGHPUT"}
+
+PAD_COLOR = (114, 114, 114)  # same grey ultralytics pads with
+
+
+# ---------------- Letterbox ---------------- #
+def letterbox(frame, size=MODEL_IMGSZ):
+    """
+    Resize a BGR frame to fit a size x size square, keeping aspect ratio, and pad the rest.
+    Returns (image, ratio, (pad_x, pad_y)) so boxes can be mapped back to the source frame.
+    """
+    h, w = frame.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if (new_w, new_h) != (w, h):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    boxed = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=PAD_COLOR)
+    return boxed, ratio, (left, top)
+
+
+def effective_batch_size(requested=None):
+    size = max(1, int(requested or INFERENCE_BATCH_SIZE))
+    if MODEL_DYNAMIC or (OV_PERFORMANCE_HINT in ASYNC_HINTS and MODEL_MAX_BATCH == 1):
+        return size
+    # Static export: the compiled model only takes its exported batch shape
+    if size != MODEL_MAX_BATCH:
+        logger.debug("Batch size %d ignored, static model expects batch %d", size, MODEL_MAX_BATCH)
+    return MODEL_MAX_BATCH
+
+
+# ---------------- OpenVINO runtime settings + warm-up ---------------- #
+def openvino_config():
+    config = {}
+    if OV_PERFORMANCE_HINT:
+        config["PERFORMANCE_HINT"] = OV_PERFORMANCE_HINT
+    if OV_NUM_THREADS:
+        config["INFERENCE_NUM_THREADS"] = OV_NUM_THREADS
+    if OV_NUM_STREAMS:
+        config["NUM_STREAMS"] = OV_NUM_STREAMS
+    if OV_PRECISION_HINT:
+        config["INFERENCE_PRECISION_HINT"] = OV_PRECISION_HINT
+    return config
+
+
+def _warm_up(model, runs):
+    blank = np.full((MODEL_IMGSZ, MODEL_IMGSZ, 3), PAD_COLOR[0], dtype=np.uint8)
+    start = time.perf_counter()
+    for _ in range(runs):
+        model.predict(blank, imgsz=MODEL_IMGSZ, verbose=False)
+    return (time.perf_counter() - start) * 1000 / max(runs, 1)
+
+
+def prepare_model(model):
+    """
+    Called once after loading. The first predict builds ultralytics' predictor (and its
+    OpenVINO compiled model with default settings); if any OV_* setting is given we then
+    recompile that graph with them, and warm up so the first request doesn't pay for it.
+    """
+    _warm_up(model, 1)
+
+    config = openvino_config()
+    backend = getattr(model.predictor, "model", None)
+    if (config or OV_DEVICE != "CPU") and getattr(backend, "xml", False):
+        try:
+            import openvino as ov
+
+            core = ov.Core()
+            xml_path = glob.glob(os.path.join(MODEL_PATH, "*.xml"))[0]
+            ov_model = core.read_model(xml_path)
+            backend.ov_compiled_model = core.compile_model(ov_model, device_name=OV_DEVICE, config=config)
+            backend.inference_mode = OV_PERFORMANCE_HINT or backend.inference_mode
+            logger.info("OpenVINO model compiled for %s with %s", OV_DEVICE, config)
+        except Exception as e:
+            logger.error("OpenVINO settings %s on %s rejected, keeping defaults: %s", config, OV_DEVICE, e)
+
+    if MODEL_WARMUP_RUNS:
+        logger.info("Model warm-up: %.1f ms/inference", _warm_up(model, MODEL_WARMUP_RUNS))
+
+
+# ---------------- Result mapping ---------------- #
+def _to_detections(result, names, ratio, pad, shape):
+    h, w = shape[:2]
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return []
+
+    xyxy = boxes.xyxy.cpu().numpy().astype(np.float32)
+    xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad[0]) / ratio).clip(0, w)
+    xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad[1]) / ratio).clip(0, h)
+    classes = boxes.cls.cpu().numpy().astype(int)
+    confs = boxes.conf.cpu().numpy()
+
+    detections = []
+    for (x1, y1, x2, y2), cls, conf in zip(xyxy, classes, confs):
+        detections.append({
+            "class": names.get(int(cls), str(cls)),
+            "conf": round(float(conf), 4),
+            "bbox": [int(x1), int(y1), int(x2), int(y2)]
+        })
+    return detections
+
+
+# ---------------- Batched prediction ---------------- #
+def predict_frames(frames, batch_size=None):
+    """
+    Detections for each decoded BGR frame, in order, with bboxes in the frame's own
+    pixel coordinates. Runs in-process, or on the shared inference server when
+    INFERENCE_SERVER_ADDRESS is set (the server does its own batching).
+    """
+    if INFERENCE_SERVER_ADDRESS:
+        from .inference_server import predict_remote
+        return predict_remote(frames)
+    return predict_local(frames, batch_size)
+
+
+def predict_local(frames, batch_size=None):
+    """
+    Run the detector over decoded BGR frames in micro-batches.
+    Returns one list of detections per input frame, in the same order, with
+    bboxes in the original frame's pixel coordinates.
+    """
+    model = get_model()
+    if model is None:
+        raise RuntimeError("YOLO model is not loaded")
+
+    batch_size = effective_batch_size(batch_size)
+    all_detections = []
+
+    for start in range(0, len(frames), batch_size):
+        chunk = frames[start:start + batch_size]
+        boxed = [letterbox(frame) for frame in chunk]
+        inputs = [b[0] for b in boxed]
+
+        # Static multi-batch exports need a full batch; pad with blank frames
+        if not MODEL_DYNAMIC and MODEL_MAX_BATCH > 1 and len(inputs) < batch_size:
+            blank = np.full_like(inputs[0], PAD_COLOR[0])
+            inputs += [blank] * (batch_size - len(inputs))
+
+        results = model.predict(inputs, imgsz=MODEL_IMGSZ, verbose=False)
+        for frame, (_, ratio, pad), result in zip(chunk, boxed, results):
+            all_detections.append(_to_detections(result, model.names, ratio, pad, frame.shape))
+
+    return all_detections
@@ -0,0 +1,272 @@
+"""
+Local inference server: loads the model once per engine process and serves every
+web worker on the host.
+
+    python -m api.inference_server --engines 2
+
+Web workers use it when INFERENCE_SERVER_ADDRESS is set. Decoded frames travel
+through shared memory; only the segment name, offsets and shapes cross the socket.
+Frames from concurrent HTTP requests are merged into batches of up to
+INFERENCE_SERVER_BATCH, waiting at most INFERENCE_SERVER_MAX_WAIT_MS for a batch to fill.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .config import (
+    logger, INFERENCE_SERVER_ADDRESS, INFERENCE_SERVER_AUTHKEY,
+    INFERENCE_SERVER_BATCH, INFERENCE_SERVER_MAX_WAIT_MS, INFERENCE_SERVER_TIMEOUT
+)
+
+SOCKET_MODE = 0o660  # owner and group (the web workers) only
+
+
+def parse_address(address):
+    """
+    Unix socket path. TCP is refused: messages are unpickled, so anyone able to reach
+    the port with the key could run code here, and shared memory is host-local anyway.
+    """
+    if not address.startswith("/") and ":" in address:
+        raise ValueError(f"INFERENCE_SERVER_ADDRESS must be a Unix socket path, not '{address}'")
+    return address
+
+
+def _attach(name):
+    shm = SharedMemory(name=name)
+    # The client owns the segment; stop this process's tracker from unlinking it on exit
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+# ---------------- Client (web workers) ---------------- #
+_local = threading.local()
+
+
+def _connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = Client(parse_address(INFERENCE_SERVER_ADDRESS), authkey=INFERENCE_SERVER_AUTHKEY)
+        _local.conn = conn
+    return conn
+
+
+def _call(message):
+    for attempt in (1, 2):
+        try:
+            conn = _connection()
+            conn.send(message)
+            # A little longer than the server's own deadline, so its error reply wins
+            if not conn.poll(INFERENCE_SERVER_TIMEOUT + 5):
+                _local.conn = None  # a late reply would be read as the answer to the next call
+                conn.close()
+                raise TimeoutError(f"No reply from the inference server after {INFERENCE_SERVER_TIMEOUT:.0f}s")
+            return conn.recv()
+        except (EOFError, OSError):
+            # Server restarted or connection dropped; reconnect once
+            _local.conn = None
+            if attempt == 2:
+                raise
+
+
+def ping():
+    return _call(("ping",)) == ("pong",)
+
+
+def predict_remote(frames):
+    """Same contract as inference.predict_local, executed by the inference server."""
+    if not frames:
+        return []
+    frames = [np.ascontiguousarray(f) for f in frames]
+    shm = SharedMemory(create=True, size=sum(f.nbytes for f in frames))
+    try:
+        descs, offset = [], 0
+        for frame in frames:
+            np.ndarray(frame.shape, frame.dtype, buffer=shm.buf, offset=offset)[:] = frame
+            descs.append((offset, frame.shape, frame.dtype.str))
+            offset += frame.nbytes
+
+        status, payload = _call(("predict", shm.name, descs))
+        if status != "ok":
+            raise RuntimeError(f"Inference server error: {payload}")
+        return payload
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+# ---------------- Engine processes ---------------- #
+def _engine_main(conn):
+    from .inference import predict_local
+
+    while True:
+        try:
+            batch = conn.recv()
+        except EOFError:
+            return
+
+        # Each request's segment is attached on its own: one that timed out and unlinked
+        # its memory fails only its own frames, not the others batched with it
+        segments, failed = {}, {}
+        for shm_name, _, _, _ in batch:
+            if shm_name in segments or shm_name in failed:
+                continue
+            try:
+                segments[shm_name] = _attach(shm_name)
+            except Exception as e:
+                failed[shm_name] = f"shared memory {shm_name} is gone: {e}"
+
+        frames = []
+        try:
+            frames = [np.ndarray(shape, np.dtype(dtype), buffer=segments[shm_name].buf, offset=offset)
+                      for shm_name, offset, shape, dtype in batch if shm_name in segments]
+            detections = iter(predict_local(frames) if frames else [])
+            conn.send(("ok", [("error", failed[shm_name]) if shm_name in failed else ("ok", next(detections))
+                              for shm_name, _, _, _ in batch]))
+        except Exception as e:
+            logger.error("Engine failed on batch: %s", e, exc_info=True)
+            conn.send(("error", str(e)))
+        finally:
+            frames = None  # views must go before the segments close
+            for shm in segments.values():
+                shm.close()
+
+
+class Engine:
+    def __init__(self, index):
+        self.index = index
+        self.conn, child = mp.Pipe()
+        self.process = mp.Process(target=_engine_main, args=(child,), name=f"inference-engine-{index}", daemon=True)
+        self.process.start()
+
+    def run(self, batch):
+        self.conn.send(batch)
+        return self.conn.recv()
+
+
+# ---------------- Server ---------------- #
+class _Request:
+    def __init__(self, size):
+        self.results = [None] * size
+        self.error = None
+        self.remaining = size
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def fill(self, index, detections=None, error=None):
+        with self.lock:
+            self.results[index] = detections
+            self.error = self.error or error
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.done.set()
+
+
+class InferenceServer:
+    def __init__(self, address, engines, batch_size, max_wait):
+        self.address = address
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.pending = queue.Queue()  # (request, index, frame descriptor)
+        self.idle = queue.Queue()
+        for i in range(engines):
+            self.idle.put(Engine(i))
+
+    def serve_forever(self):
+        threading.Thread(target=self._batcher, name="batcher", daemon=True).start()
+        if os.path.exists(self.address):
+            os.remove(self.address)  # stale socket from a previous run
+        with Listener(self.address, family="AF_UNIX", authkey=INFERENCE_SERVER_AUTHKEY) as listener:
+            os.chmod(self.address, SOCKET_MODE)
+            logger.info("Inference server listening on %s (%d engine(s), batch %d, max wait %.1f ms)",
+                        self.address, self.idle.qsize(), self.batch_size, self.max_wait * 1000)
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.warning("Rejected inference client: %s", e)
+                    continue
+                threading.Thread(target=self._client, args=(conn,), daemon=True).start()
+
+    def _client(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                if message[0] == "ping":
+                    conn.send(("pong",))
+                    continue
+
+                _, shm_name, descs = message
+                request = _Request(len(descs))
+                for index, (offset, shape, dtype) in enumerate(descs):
+                    self.pending.put((request, index, (shm_name, offset, shape, dtype)))
+                if not request.done.wait(INFERENCE_SERVER_TIMEOUT):
+                    # Frames still queued fail on their own once the client unlinks the segment
+                    conn.send(("error", f"timed out after {INFERENCE_SERVER_TIMEOUT:.0f}s"))
+                    continue
+                conn.send(("error", request.error) if request.error else ("ok", request.results))
+
+    def _batcher(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            engine = self.idle.get()  # blocks while every engine is busy; the queue keeps filling
+            threading.Thread(target=self._dispatch, args=(engine, batch), daemon=True).start()
+
+    def _dispatch(self, engine, batch):
+        try:
+            status, payload = engine.run([desc for _, _, desc in batch])
+        except Exception as e:
+            # Engine process died or its pipe broke; replace it
+            logger.error("Inference engine %d failed, restarting: %s", engine.index, e)
+            status, payload = "error", str(e)
+            engine.process.kill()
+            engine = Engine(engine.index)
+        finally:
+            self.idle.put(engine)
+
+        for i, (request, index, _) in enumerate(batch):
+            if status != "ok":
+                request.fill(index, error=payload)
+            elif payload[i][0] == "ok":
+                request.fill(index, detections=payload[i][1])
+            else:
+                request.fill(index, error=payload[i][1])
+
+
+def main():
+    from .inference import effective_batch_size
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", default=INFERENCE_SERVER_ADDRESS or "/tmp/buck-tracker-inference.sock")
+    parser.add_argument("--engines", type=int, default=1, help="model processes (one model copy each)")
+    parser.add_argument("--batch", type=int, default=INFERENCE_SERVER_BATCH or effective_batch_size())
+    parser.add_argument("--max-wait-ms", type=float, default=INFERENCE_SERVER_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    mp.set_start_method("spawn", force=True)  # engines load the model themselves
+    InferenceServer(parse_address(args.address), args.engines, args.batch, args.max_wait_ms / 1000).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
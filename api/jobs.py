@@ -0,0 +1,237 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from flask import current_app, request
+
+from .config import logger, JOBS_DB_PATH, JOBS_SPOOL_DIR, JOB_WORKERS, JOB_RETENTION_HOURS
+
+POLL_INTERVAL = 1.0     # seconds between queue polls when idle
+STALE_AFTER = 15 * 60   # a "running" job untouched this long is assumed orphaned and re-queued
+HOUSEKEEPING_INTERVAL = 60  # seconds between stale/expired job sweeps
+
+_runners = {}
+_wakeup = threading.Event()
+_workers_lock = threading.Lock()
+_workers = []
+_last_housekeeping = 0.0
+
+
+# ---------------- Job store (SQLite, shared by every process on the host) ---------------- #
+_store_ready = False
+
+
+def _connect():
+    if not _store_ready:
+        _init_store()
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _init_store():
+    global _store_ready
+    os.makedirs(JOBS_SPOOL_DIR, exist_ok=True)
+    with closing(sqlite3.connect(JOBS_DB_PATH, timeout=30)) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                files TEXT NOT NULL,
+                request_path TEXT NOT NULL,
+                base_url TEXT NOT NULL,
+                summary TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            );
+        """)
+    _store_ready = True
+
+
+def register_runner(kind, fn):
+    """fn(job_id, user_id, uploads) -> summary dict. Called on a worker thread inside a request context."""
+    _runners[kind] = fn
+
+
+def submit(kind, user_id, uploads):
+    """Spool uploads to disk, queue the job and make sure this process has workers running."""
+    _ensure_workers(current_app._get_current_object())
+
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(JOBS_SPOOL_DIR, job_id)
+    os.makedirs(job_dir)
+    files = []
+    for idx, (filename, file_bytes) in enumerate(uploads):
+        path = os.path.join(job_dir, str(idx))
+        with open(path, "wb") as f:
+            f.write(file_bytes)
+        files.append([filename, path])
+
+    now = time.time()
+    with closing(_connect()) as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, user_id, status, total, files, request_path, base_url, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, user_id, len(files), json.dumps(files), request.path, request.host_url, now, now)
+        )
+    _wakeup.set()
+    logger.info("Queued %s job %s with %d file(s)", kind, job_id, len(files))
+    return job_id
+
+
+def add_result(job_id, result):
+    with closing(_connect()) as conn:
+        conn.execute(
+            "INSERT INTO job_results (job_id, seq, result) "
+            "SELECT ?, COALESCE(MAX(seq), -1) + 1, ? FROM job_results WHERE job_id=?",
+            (job_id, json.dumps(result, default=str), job_id)
+        )
+        conn.execute("UPDATE jobs SET updated_at=? WHERE id=?", (time.time(), job_id))
+
+
+def get_job(job_id):
+    with closing(_connect()) as conn:
+        job = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        results = [json.loads(r["result"]) for r in
+                   conn.execute("SELECT result FROM job_results WHERE job_id=? ORDER BY seq", (job_id,))]
+
+    payload = {
+        "job_id": job["id"],
+        "user_id": job["user_id"],
+        "status": job["status"],
+        "total": job["total"],
+        "processed": len(results),
+        "results": results,
+    }
+    if job["summary"]:
+        payload["summary"] = json.loads(job["summary"])
+    if job["error"]:
+        payload["error"] = job["error"]
+    return payload
+
+
+# ---------------- Workers ---------------- #
+def _claim():
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        job = conn.execute(
+            "SELECT * FROM jobs WHERE status='queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if job is not None:
+            conn.execute("UPDATE jobs SET status='running', updated_at=? WHERE id=?", (time.time(), job["id"]))
+            # A re-queued job starts over; drop the results of the run that was abandoned
+            conn.execute("DELETE FROM job_results WHERE job_id=?", (job["id"],))
+        conn.execute("COMMIT")
+        return job
+
+
+def _finish(job_id, status, summary=None, error=None):
+    with closing(_connect()) as conn:
+        conn.execute(
+            "UPDATE jobs SET status=?, summary=?, error=?, updated_at=? WHERE id=?",
+            (status, json.dumps(summary, default=str) if summary is not None else None, error, time.time(), job_id)
+        )
+    shutil.rmtree(os.path.join(JOBS_SPOOL_DIR, job_id), ignore_errors=True)
+
+
+def _run(app, job):
+    runner = _runners.get(job["kind"])
+    if runner is None:
+        _finish(job["id"], "failed", error=f"No runner for job kind '{job['kind']}'")
+        return
+
+    uploads = []
+    for filename, path in json.loads(job["files"]):
+        with open(path, "rb") as f:
+            uploads.append((filename, f.read()))
+
+    try:
+        with app.test_request_context(job["request_path"], base_url=job["base_url"], method="POST"):
+            summary = runner(job["id"], job["user_id"], uploads)
+        _finish(job["id"], "done", summary=summary)
+        logger.info("Job %s done", job["id"])
+    except Exception as e:
+        logger.error("Job %s failed: %s", job["id"], e, exc_info=True)
+        _finish(job["id"], "failed", error=str(e))
+
+
+def _housekeeping():
+    now = time.time()
+    with closing(_connect()) as conn:
+        conn.execute("UPDATE jobs SET status='queued' WHERE status='running' AND updated_at < ?",
+                     (now - STALE_AFTER,))
+        expired = [r["id"] for r in conn.execute(
+            "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (now - JOB_RETENTION_HOURS * 3600,))]
+        for job_id in expired:
+            conn.execute("DELETE FROM job_results WHERE job_id=?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id=?", (job_id,))
+
+
+def _maybe_housekeeping():
+    global _last_housekeeping
+    with _workers_lock:
+        if time.monotonic() - _last_housekeeping < HOUSEKEEPING_INTERVAL:
+            return
+        _last_housekeeping = time.monotonic()
+    try:
+        _housekeeping()
+    except sqlite3.Error as e:
+        logger.warning("Job housekeeping failed: %s", e)
+
+
+def _worker_loop(app):
+    # Nothing may escape this loop: a dead worker thread is never restarted
+    while True:
+        _maybe_housekeeping()
+        try:
+            job = _claim()
+        except sqlite3.Error as e:
+            logger.warning("Job queue poll failed: %s", e)
+            job = None
+        if job is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        try:
+            _run(app, job)
+        except Exception as e:
+            # Spool files gone, or the job store failed while recording the outcome
+            logger.error("Job %s crashed: %s", job["id"], e, exc_info=True)
+            try:
+                _finish(job["id"], "failed", error=str(e))
+            except sqlite3.Error as e:
+                logger.error("Could not mark job %s failed (re-queued once stale): %s", job["id"], e)
+
+
+def _ensure_workers(app):
+    """Workers live in-process so they reuse the YOLO model this process already loaded."""
+    if _workers:
+        return
+    with _workers_lock:
+        if _workers:
+            return
+        for i in range(JOB_WORKERS):
+            t = threading.Thread(target=_worker_loop, args=(app,), name=f"job-worker-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+        logger.info("Started %d job worker thread(s)", JOB_WORKERS)
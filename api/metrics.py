@@ -0,0 +1,271 @@
+"""
+In-process metrics in the Prometheus text format, served on /metrics, plus an
+optional sampling profiler that writes folded stacks for slow requests.
+
+    with metrics.timer(metrics.QUERY_SECONDS, "dashboard_rollup"):
+        cursor.execute(...)
+
+Every process (gunicorn worker) keeps its own numbers; scrape each one or let
+Prometheus aggregate per instance.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+from .config import (
+    logger, METRICS_ENABLED, PROFILE_SLOW_REQUEST_MS, PROFILE_SAMPLE_INTERVAL_MS,
+    PROFILE_DIR, PROFILE_MAX_FILES
+)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# ---------------- Metric types ---------------- #
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self._series = {}  # label values -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *label_values):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += seconds
+
+    def render(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for values, series in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), values + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, values)} {series[-1]:.6f}"
+            yield f"{self.name}_count{_labels(self.labels, values)} {cumulative}"
+
+
+class CounterMetric:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, n=1):
+        with self._lock:
+            self._values[label_values] += n
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, count in items:
+            yield f"{self.name}{_labels(self.labels, values)} {count}"
+
+
+class GaugeMetric:
+    """Read at scrape time from a callback, so the owner keeps the number."""
+    kind = "gauge"
+
+    def __init__(self, name, help, read):
+        self.name, self.help, self.read = name, help, read
+
+    def render(self):
+        yield f"{self.name} {self.read()}"
+
+
+_registry = []
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, help, labels, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def counter(name, help, labels=()):
+    metric = CounterMetric(name, help, labels)
+    _registry.append(metric)
+    return metric
+
+
+def gauge(name, help, read):
+    metric = GaugeMetric(name, help, read)
+    _registry.append(metric)
+    return metric
+
+
+REQUEST_SECONDS = histogram("http_request_duration_seconds", "Request latency by endpoint",
+                            ("endpoint", "method", "status"))
+STAGE_SECONDS = histogram("pipeline_stage_duration_seconds",
+                          "Time per process-images stage span (read, hash, decode, exif, inference, ...)", ("stage",))
+QUERY_SECONDS = histogram("db_query_duration_seconds", "Named SQL query latency", ("query",))
+STORAGE_SECONDS = histogram("storage_operation_duration_seconds", "Object storage call latency", ("backend", "op"))
+SLOW_REQUESTS = counter("slow_requests_total", "Requests over PROFILE_SLOW_REQUEST_MS", ("endpoint",))
+
+
+@contextmanager
+def timer(metric, *label_values):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric.observe(time.perf_counter() - start, *label_values)
+
+
+def render():
+    from .db import pool_stats
+
+    lines = []
+    for metric in _registry:
+        lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+        lines += metric.render()
+
+    # Pool state as gauges, straight from api/db.py
+    gauges = {"in_use": "db_pool_connections_in_use", "idle": "db_pool_connections_idle",
+              "timeouts": "db_pool_timeouts_total", "connection_errors": "db_pool_connection_errors_total",
+              "wait_seconds_total": "db_pool_wait_seconds_total"}
+    stats = pool_stats()
+    for key, name in gauges.items():
+        lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+        lines += [f'{name}{{pool="{pool}"}} {values[key]}' for pool, values in sorted(stats.items())]
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- Slow-request sampling profiler ---------------- #
+def _folded(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class SlowRequestProfiler:
+    """
+    Samples the stack of every thread currently serving a request. Requests slower
+    than the threshold get their samples written as folded stacks
+    (flamegraph.pl / speedscope input); the rest are dropped. Work handed to the
+    preprocess / storage pools runs on other threads and is not included.
+    """
+
+    def __init__(self, threshold_ms, interval_ms, out_dir, max_files):
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000
+        self.out_dir = out_dir
+        self.max_files = max_files
+        self._active = {}  # thread ident -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._thread = None
+        os.makedirs(out_dir, exist_ok=True)
+
+    def begin(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._thread.start()
+
+    def end(self, label, elapsed_ms):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if samples and elapsed_ms >= self.threshold_ms:
+            self._write(label, elapsed_ms, samples)
+
+    def _sample(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None and ident != me:
+                        samples[_folded(frame)] += 1
+            frames = None
+
+    def _write(self, label, elapsed_ms, samples):
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{label.replace('/', '_')}-{int(elapsed_ms)}ms.folded"
+        path = os.path.join(self.out_dir, name)
+        try:
+            with open(path, "w") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.info("Slow request %s (%.0f ms): profile written to %s", label, elapsed_ms, path)
+            self._prune()
+        except OSError as e:
+            logger.warning("Could not write profile for %s: %s", label, e)
+
+    def _prune(self):
+        files = sorted(os.path.join(self.out_dir, f) for f in os.listdir(self.out_dir) if f.endswith(".folded"))
+        for path in files[:-self.max_files]:
+            os.remove(path)
+
+
+profiler = None
+if PROFILE_SLOW_REQUEST_MS > 0:
+    profiler = SlowRequestProfiler(PROFILE_SLOW_REQUEST_MS, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_DIR,
+                                   PROFILE_MAX_FILES)
+
+
+# ---------------- Flask wiring ---------------- #
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+
+def init_app(app):
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_timer():
+        g._request_started = time.perf_counter()
+        if profiler is not None:
+            profiler.begin()
+
+    @app.after_request
+    def _record(response):
+        # Streamed responses are timed to their first byte
+        started = g.pop("_request_started", None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            REQUEST_SECONDS.observe(elapsed, _endpoint(), request.method, str(response.status_code))
+            if PROFILE_SLOW_REQUEST_MS and elapsed * 1000 >= PROFILE_SLOW_REQUEST_MS:
+                SLOW_REQUESTS.inc(_endpoint())
+            if profiler is not None:
+                profiler.end(_endpoint(), elapsed * 1000)
+        return response
+
+    @app.teardown_request
+    def _drop_profile(exc):
+        if profiler is not None:
+            profiler.end(_endpoint(), 0)  # no-op unless after_request never ran
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,216 @@
+import hashlib
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from .config import logger, PREPROCESS_WORKERS, REDUCED_DECODE, MODEL_IMGSZ, PREFILTER_ENABLED
+from .inference import predict_frames, effective_batch_size
+from . import prefilter, result_cache
+from .exif import read_exif
+from .metrics import STAGE_SECONDS
+from .utils import scan_jpeg
+
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# Shared across requests so concurrent uploads can't spawn unbounded threads
+_executor = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="preprocess")
+
+
+# ---------------- Stage timings ---------------- #
+class StageTimer:
+    """
+    Accumulates seconds spent per named stage. Safe to use from worker threads.
+    Each span is also observed in the pipeline_stage_duration_seconds histogram.
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        STAGE_SECONDS.observe(seconds, name)
+        with self._lock:
+            self.totals[name] += seconds
+
+    def as_ms(self):
+        with self._lock:
+            timings = {name: round(sec * 1000, 1) for name, sec in self.totals.items()}
+        timings["wall"] = round((time.perf_counter() - self._start) * 1000, 1)
+        return timings
+
+
+# ---------------- Preprocess stages (run on the pool) ---------------- #
+def _hash_upload(file_bytes, timer):
+    with timer.stage("hash"):
+        return hashlib.md5(file_bytes).hexdigest()
+
+
+def hash_uploads(uploads, timer):
+    """uploads: list of (filename, file_bytes). Returns (filename, file_bytes, file_hash) tuples."""
+    hashes = _executor.map(lambda upload: _hash_upload(upload[1], timer), uploads)
+    return [(filename, file_bytes, file_hash) for (filename, file_bytes), file_hash in zip(uploads, hashes)]
+
+
+def decode_factor(size, target=MODEL_IMGSZ):
+    """Largest JPEG DCT scale (1/2, 1/4, 1/8) that still leaves the long side >= the model input."""
+    if size is None:
+        return 1
+    long_side = max(size)
+    for factor in (8, 4, 2):
+        if long_side // factor >= target:
+            return factor
+    return 1
+
+
+def decode_frame(file_bytes, reduced=REDUCED_DECODE, size=None):
+    """
+    Decode for inference. Returns (frame, scale) where scale = (sx, sy) maps frame
+    pixels back to full-resolution pixels. size is the JPEG header size if already known.
+    """
+    if reduced and size is None:
+        size = scan_jpeg(file_bytes)[0]
+    factor = decode_factor(size) if reduced else 1
+    flag = REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+    frame = cv2.imdecode(np.frombuffer(file_bytes, np.uint8), flag)
+    if frame is None or factor == 1:
+        return frame, (1.0, 1.0)
+
+    width, height = size
+    frame_h, frame_w = frame.shape[:2]
+    if (frame_w > frame_h) != (width > height):
+        width, height = height, width  # EXIF orientation rotated the decoded frame
+    return frame, (width / frame_w, height / frame_h)
+
+
+def prepare_upload(filename, file_bytes, file_hash, timer, cached=None, status="detected"):
+    """
+    cached: detections already known (result cache hit, or [] for a prefiltered
+    image); the image is then not decoded at all. status records which it was.
+    """
+    # One header walk feeds both the reduced decode and the EXIF reader
+    with timer.stage("exif"):
+        size, exif_payload = scan_jpeg(file_bytes)
+        exif = read_exif(file_bytes, exif_payload)
+    metadata = exif.as_dict()
+    metadata["file_hash"] = file_hash
+
+    frame, scale = None, (1.0, 1.0)
+    if cached is None:
+        with timer.stage("decode"):
+            frame, scale = decode_frame(file_bytes, size=size)
+
+    return {
+        "filename": filename,
+        "file_hash": file_hash,
+        "frame": frame,
+        "scale": scale,
+        "cached": cached,
+        "status": status,
+        "exif": exif,
+        "metadata": metadata,
+    }
+
+
+def to_full_resolution(detections, scale):
+    sx, sy = scale
+    if sx == 1.0 and sy == 1.0:
+        return detections
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+        det["bbox"] = [int(x1 * sx), int(y1 * sy), int(x2 * sx), int(y2 * sy)]
+    return detections
+
+
+# ---------------- Preprocess -> inference pipeline ---------------- #
+def iter_detections(uploads, timer, accept=None, batch_size=None, first_batch=None, precomputed=None):
+    """
+    uploads: list of (filename, file_bytes, file_hash), see hash_uploads().
+    Yields (prepared, detections) in upload order. Preprocessing of later images
+    keeps running on the pool while a micro-batch is in inference. Images already in
+    the result cache (same bytes, same model and settings) skip decode and inference,
+    as do images the prefilter (PREFILTER_ENABLED) judges empty, with status "prefiltered".
+    precomputed: {file_hash: detections} worked out already (sequence mode), status "sequence".
+    accept(prepared) may return False to drop an image before inference.
+    first_batch caps the first micro-batch (streaming uses 1 so the first result
+    doesn't wait for a full batch).
+    """
+    batch_size = effective_batch_size(batch_size)
+    limit = min(first_batch or batch_size, batch_size)
+    max_in_flight = PREPROCESS_WORKERS + batch_size  # bounds decoded frames held in memory
+    queue = iter(uploads)
+    in_flight = deque()
+    batch = []
+
+    precomputed = precomputed or {}
+    with timer.stage("result_cache"):
+        cached = result_cache.get_many([file_hash for _, _, file_hash in uploads if file_hash not in precomputed])
+
+    skipped = set()
+    if PREFILTER_ENABLED:
+        with timer.stage("prefilter"):
+            candidates = [(h, b, read_exif(b)) for _, b, h in uploads if h not in cached and h not in precomputed]
+            skipped = prefilter.plan(candidates, _executor)
+
+    def fill():
+        while len(in_flight) < max_in_flight:
+            item = next(queue, None)
+            if item is None:
+                return
+            file_hash = item[2]
+            if file_hash in precomputed:
+                known = (precomputed[file_hash], "sequence")
+            elif file_hash in cached:
+                known = (cached[file_hash], "cached")
+            elif file_hash in skipped:
+                known = ([], "prefiltered")
+            else:
+                known = (None, "detected")
+            in_flight.append(_executor.submit(prepare_upload, *item, timer, *known))
+
+    def run(batch):
+        todo = [p for p in batch if p["cached"] is None]
+        detections = []
+        if todo:
+            with timer.stage("inference"):
+                detections = predict_frames([p["frame"] for p in todo], batch_size=batch_size)
+        # Stored bboxes stay in original-image coordinates whatever scale we decoded at
+        fresh = {p["file_hash"]: to_full_resolution(d, p["scale"]) for p, d in zip(todo, detections)}
+        with timer.stage("result_cache"):
+            result_cache.put_many(fresh)
+        return [(p, p["cached"] if p["cached"] is not None else fresh[p["file_hash"]]) for p in batch]
+
+    fill()
+    while in_flight:
+        with timer.stage("preprocess_wait"):
+            prepared = in_flight.popleft().result()
+        fill()
+
+        if accept is not None and not accept(prepared):
+            continue
+        if prepared["cached"] is not None and not batch:
+            yield prepared, prepared["cached"]  # nothing ahead of it is waiting for inference
+            continue
+        batch.append(prepared)
+        if sum(p["cached"] is None for p in batch) >= limit:
+            yield from run(batch)
+            batch = []
+            limit = batch_size
+
+    if batch:
+        yield from run(batch)
+
+    logger.info("Pipeline timings (ms): %s", timer.as_ms())
@@ -0,0 +1,70 @@
+"""
+Empty-frame prefilter. Trail cams mostly fire on wind or sun; such a frame looks like
+the camera's other frames from around the same time. Each image (with EXIF camera
+and capture time) is compared, as a small blurred grey thumbnail, against the median
+of its peers: frames from the same camera within PREFILTER_WINDOW_SECONDS, excluding
+its own trigger burst (an animal in every shot of a burst would otherwise become
+the background). Images whose changed-pixel fraction is under PREFILTER_MIN_CHANGED
+skip the detector. Images without enough peers always go to the detector.
+
+Peers come only from the same upload request (at most 32 files); frames stored by
+earlier requests are not consulted. A single upload, or a camera with too few
+frames in the request, is therefore never prefiltered.
+
+Tune with benchmarks/prefilter_report.py against a labelled sample.
+"""
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from .config import (
+    PREFILTER_SIZE, PREFILTER_PIXEL_DELTA, PREFILTER_MIN_CHANGED, PREFILTER_WINDOW_SECONDS,
+    PREFILTER_BURST_SECONDS, PREFILTER_MIN_PEERS
+)
+
+
+def thumbnail(file_bytes):
+    """Small grey frame with its mean removed (so an exposure shift isn't a 'change'), or None."""
+    img = cv2.imdecode(np.frombuffer(file_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        return None
+    img = cv2.resize(img, PREFILTER_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+    img = cv2.GaussianBlur(img, (3, 3), 0)
+    return img - img.mean()
+
+
+def change_scores(items, executor=None):
+    """
+    items: (key, file_bytes, exif record). Returns {key: changed fraction vs. peers},
+    None where an image couldn't be scored.
+    """
+    scores = {key: None for key, _, _ in items}
+    by_camera = defaultdict(list)
+    for key, file_bytes, exif in items:
+        if exif.camera and exif.captured_at:
+            by_camera[exif.camera].append((exif.captured_at.timestamp(), key, file_bytes))
+
+    frames = [f for group in by_camera.values() if len(group) > PREFILTER_MIN_PEERS for f in group]
+    if not frames:
+        return scores
+    thumbs = (executor.map if executor else map)(thumbnail, [file_bytes for _, _, file_bytes in frames])
+    thumbs = {key: t for (_, key, _), t in zip(frames, thumbs) if t is not None}
+
+    for group in by_camera.values():
+        for taken, key, _ in group:
+            if key not in thumbs:
+                continue
+            peers = [thumbs[k] for t, k, _ in group
+                     if k in thumbs and k != key and PREFILTER_BURST_SECONDS < abs(t - taken) <= PREFILTER_WINDOW_SECONDS]
+            if len(peers) < PREFILTER_MIN_PEERS:
+                continue
+            background = np.median(np.stack(peers), axis=0)
+            scores[key] = float((np.abs(thumbs[key] - background) > PREFILTER_PIXEL_DELTA).mean())
+    return scores
+
+
+def plan(items, executor=None, min_changed=PREFILTER_MIN_CHANGED):
+    """Keys of the images that should skip the detector (judged against this batch only)."""
+    return {key for key, score in change_scores(items, executor).items()
+            if score is not None and score < min_changed}
@@ -0,0 +1,128 @@
+"""
+Detection results keyed by (file hash, model fingerprint). The fingerprint covers the
+bytes under MODEL_PATH and every setting that changes the boxes, so replacing the
+model or changing those settings starts a fresh cache; rows from older fingerprints
+are purged when the store is opened. Shared by every process on the host.
+"""
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from .config import (
+    logger, MODEL_PATH, MODEL_IMGSZ, OV_PRECISION_HINT, REDUCED_DECODE,
+    RESULT_CACHE_ENABLED, RESULT_CACHE_PATH, RESULT_CACHE_MAX_ENTRIES
+)
+
+EVICT_CHECK_EVERY = 500  # puts between size checks
+
+_lock = threading.Lock()
+_fingerprint = None
+_puts_since_check = 0
+
+
+def fingerprint():
+    """Hash of the model files plus the inference settings that affect results."""
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha1()
+        for path in sorted(glob.glob(os.path.join(MODEL_PATH, "**", "*"), recursive=True)):
+            if os.path.isfile(path):
+                digest.update(os.path.relpath(path, MODEL_PATH).encode())
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(chunk)
+        settings = {"imgsz": MODEL_IMGSZ, "precision": OV_PRECISION_HINT, "reduced_decode": REDUCED_DECODE}
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+# ---------------- Store ---------------- #
+_store_ready = False
+
+
+def _connect():
+    if not _store_ready:
+        _init_store()
+    return sqlite3.connect(RESULT_CACHE_PATH, timeout=30, isolation_level=None)
+
+
+def _init_store():
+    global _store_ready
+    with _lock:
+        if _store_ready:
+            return
+        with closing(sqlite3.connect(RESULT_CACHE_PATH, timeout=30, isolation_level=None)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    file_hash TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    detections TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (file_hash, fingerprint)
+                );
+                CREATE INDEX IF NOT EXISTS idx_results_last_used ON results (last_used);
+            """)
+            purged = conn.execute("DELETE FROM results WHERE fingerprint != ?", (fingerprint(),)).rowcount
+            if purged:
+                logger.info("Result cache: dropped %d entries from a previous model/settings", purged)
+        _store_ready = True
+
+
+def get_many(file_hashes):
+    """{file_hash: detections} for the hashes we already have results for."""
+    if not RESULT_CACHE_ENABLED or not file_hashes:
+        return {}
+    hashes = list(set(file_hashes))
+    placeholders = ", ".join(["?"] * len(hashes))
+    try:
+        with closing(_connect()) as conn:
+            rows = conn.execute(f"SELECT file_hash, detections FROM results "
+                                f"WHERE fingerprint = ? AND file_hash IN ({placeholders})",
+                                [fingerprint()] + hashes).fetchall()
+            if rows:
+                conn.execute(f"UPDATE results SET last_used = ? WHERE fingerprint = ? AND file_hash IN "
+                             f"({', '.join(['?'] * len(rows))})", [time.time(), fingerprint()] + [r[0] for r in rows])
+    except sqlite3.Error as e:
+        logger.warning("Result cache lookup failed: %s", e)
+        return {}
+    return {file_hash: json.loads(detections) for file_hash, detections in rows}
+
+
+def put_many(results):
+    """results: {file_hash: detections in original-image coordinates}."""
+    global _puts_since_check
+    if not RESULT_CACHE_ENABLED or not results:
+        return
+    now = time.time()
+    rows = [(h, fingerprint(), json.dumps(d), now) for h, d in results.items()]
+    try:
+        with closing(_connect()) as conn:
+            conn.executemany("INSERT OR REPLACE INTO results (file_hash, fingerprint, detections, last_used) "
+                             "VALUES (?, ?, ?, ?)", rows)
+            with _lock:
+                _puts_since_check += len(rows)
+                check = _puts_since_check >= EVICT_CHECK_EVERY
+                if check:
+                    _puts_since_check = 0
+            if check:
+                _evict(conn)
+    except sqlite3.Error as e:
+        logger.warning("Result cache write failed: %s", e)
+
+
+def _evict(conn):
+    # Least recently used out, down to 90% of the cap so we don't evict on every write
+    count = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    if count <= RESULT_CACHE_MAX_ENTRIES:
+        return
+    excess = count - int(RESULT_CACHE_MAX_ENTRIES * 0.9)
+    conn.execute("DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY last_used LIMIT ?)",
+                 (excess,))
+    logger.info("Result cache evicted %d entries", excess)
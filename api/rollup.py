@@ -0,0 +1,79 @@
+from collections import defaultdict
+
+from .config import DASHBOARD_CACHE_TTL
+from .utils import TTLCache
+
+IMAGE_ROW = ""  # detected_class of the rows that count images rather than detections
+
+# user_id -> dashboard payload, dropped whenever this process writes for the user
+dashboard_cache = TTLCache(DASHBOARD_CACHE_TTL)
+
+
+def camera_of(metadata):
+    camera = (metadata or {}).get("camera")
+    return str(camera)[:255] if camera else ""
+
+
+class RollupDelta:
+    """
+    Accumulates +/- counts for user_detection_rollup (user x class x camera x day)
+    so a request can apply all of its changes with one upsert.
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(lambda: [0, 0])  # key -> [images, detections]
+
+    def image(self, user_id, camera, day, n=1):
+        self.counts[(user_id, IMAGE_ROW, camera, day)][0] += n
+
+    def detection(self, user_id, detected_class, camera, day, n=1):
+        self.counts[(user_id, detected_class, camera, day)][1] += n
+
+    def apply(self, cursor):
+        rows = [key + tuple(c) for key, c in self.counts.items() if c[0] or c[1]]
+        if rows:
+            cursor.executemany("""
+                INSERT INTO user_detection_rollup (user_id, detected_class, camera, day, image_count, detection_count)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    image_count = image_count + VALUES(image_count),
+                    detection_count = detection_count + VALUES(detection_count)
+            """, rows)
+
+    def users(self):
+        return {key[0] for key in self.counts}
+
+
+def invalidate(user_ids):
+    for user_id in user_ids:
+        dashboard_cache.invalidate(user_id)
+
+
+AMBIGUOUS = "ambiguous"
+
+
+def find_image(cursor, user_id, image_name=None, image_id=None):
+    """
+    (image id, camera, day) of one stored image, by id or else by name. None if the
+    user has no such image, AMBIGUOUS if the name belongs to more than one upload.
+    """
+    if image_id is not None:
+        cursor.execute("""
+            SELECT id, camera, DATE(created_at) AS day
+            FROM user_images
+            WHERE user_id=%s AND id=%s
+        """, (user_id, image_id))
+    else:
+        cursor.execute("""
+            SELECT id, camera, DATE(created_at) AS day
+            FROM user_images
+            WHERE user_id=%s AND image_name=%s
+            LIMIT 2
+        """, (user_id, image_name))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    if len(rows) > 1:
+        return AMBIGUOUS
+    row = rows[0]
+    return row["id"], (row["camera"] or "")[:255], row["day"]
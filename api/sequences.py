@@ -0,0 +1,241 @@
+"""
+Sequence ingestion: a trail-cam burst or clip is one event, stored once.
+
+Photos are grouped into bursts by EXIF camera and capture time (shots at most
+SEQUENCE_BURST_GAP seconds apart); photos without both stand alone. Each video is
+its own sequence. Only SEQUENCE_SAMPLE_FRAMES evenly spaced frames per sequence are
+decoded and run through the detector, in one batched pass; videos are seeked to the
+sampled frames rather than decoded end to end. Boxes are linked across the sampled
+frames by class and IoU, and the sequence is kept as its representative frame: the
+sample showing the most tracks, total confidence breaking ties. That frame and its
+detections go through the normal upload path; the metadata records the sequence, and
+the hashes of all its source files are kept so none of them is processed again.
+"""
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+
+import cv2
+
+from .config import (
+    logger, VIDEO_EXTENSIONS, SEQUENCE_BURST_GAP, SEQUENCE_SAMPLE_FRAMES, SEQUENCE_TRACK_IOU,
+    SEQUENCE_STORE_CLIPS
+)
+from . import result_cache
+from .exif import read_exif
+from .inference import predict_frames
+from .pipeline import _executor, decode_factor, decode_frame, to_full_resolution
+from .storage import object_key, put_async
+
+JPEG_QUALITY = 92  # representative frames taken from video
+
+
+def is_video(filename):
+    return os.path.splitext(filename)[1].lower() in VIDEO_EXTENSIONS
+
+
+def sample_indices(count, samples=SEQUENCE_SAMPLE_FRAMES):
+    """Evenly spaced indices including the first and last; the middle one if only one is wanted."""
+    if count <= samples:
+        return list(range(count))
+    if samples == 1:
+        return [count // 2]
+    return sorted({round(i * (count - 1) / (samples - 1)) for i in range(samples)})
+
+
+def group_bursts(photos, gap=SEQUENCE_BURST_GAP):
+    """photos: (filename, file_bytes, exif record, ...). Returns lists of photos, each in capture order."""
+    dated = sorted((p for p in photos if p[2].camera and p[2].captured_at),
+                   key=lambda p: (p[2].camera, p[2].captured_at, p[0]))
+    bursts = [[p] for p in photos if not (p[2].camera and p[2].captured_at)]
+    current = []
+    for photo in dated:
+        last = current[-1][2] if current else None
+        if last and (last.camera != photo[2].camera
+                     or photo[2].captured_at - last.captured_at > timedelta(seconds=gap)):
+            bursts.append(current)
+            current = []
+        current.append(photo)
+    if current:
+        bursts.append(current)
+    return bursts
+
+
+def iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def link_tracks(frame_detections, min_iou=SEQUENCE_TRACK_IOU):
+    """
+    Greedy frame-to-frame matching: each box joins the same-class track whose latest
+    box overlaps it most (at least min_iou), else starts a new track.
+    Returns tracks as lists of (frame index, detection).
+    """
+    tracks = []
+    for index, detections in enumerate(frame_detections):
+        taken = set()
+        for det in sorted(detections, key=lambda d: -d["conf"]):
+            best, best_iou = None, min_iou
+            for t, track in enumerate(tracks):
+                last_index, last = track[-1]
+                if t in taken or last_index == index or last["class"] != det["class"]:
+                    continue
+                overlap = iou(last["bbox"], det["bbox"])
+                if overlap >= best_iou:
+                    best, best_iou = t, overlap
+            if best is None:
+                tracks.append([(index, det)])
+                taken.add(len(tracks) - 1)
+            else:
+                tracks[best].append((index, det))
+                taken.add(best)
+    return tracks
+
+
+def representative(frame_detections):
+    """(index of the frame to keep, tracks per class)."""
+    tracks = link_tracks(frame_detections)
+    present = [0] * len(frame_detections)
+    for track in tracks:
+        for index, _ in track:
+            present[index] += 1
+    best = max(range(len(frame_detections)),
+               key=lambda i: (present[i], sum(d["conf"] for d in frame_detections[i]), -i))
+    per_class = {}
+    for track in tracks:
+        cls = track[0][1]["class"]
+        per_class[cls] = per_class.get(cls, 0) + 1
+    return best, per_class
+
+
+# ---------------- Frame sampling ---------------- #
+def _decode_photo(photo, timer):
+    with timer.stage("decode"):
+        return decode_frame(photo[1])
+
+
+def _video_frames(filename, file_bytes, timer):
+    """
+    (frame count, [(jpeg bytes, frame, scale)]) for the sampled frames. Frames are
+    kept as JPEG at full size for storage and shrunk for inference, like a reduced
+    JPEG decode. OpenCV needs a path, so the clip goes through a temp file.
+    """
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1].lower())
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(file_bytes)
+        with timer.stage("video_decode"):
+            capture = cv2.VideoCapture(path)
+            try:
+                count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+                frames = []
+                for index in sample_indices(count):
+                    # Seeks to the nearest keyframe and decodes forward to the sample only
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+                    ok, frame = capture.read()
+                    if not ok:
+                        continue
+                    ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                    if not ok:
+                        continue
+                    height, width = frame.shape[:2]
+                    factor = decode_factor((width, height))
+                    if factor > 1:
+                        frame = cv2.resize(frame, (width // factor, height // factor), interpolation=cv2.INTER_AREA)
+                    frames.append((encoded.tobytes(), frame, (width / frame.shape[1], height / frame.shape[0])))
+            finally:
+                capture.release()
+    finally:
+        os.remove(path)
+    return count, frames
+
+
+# ---------------- Collapse uploads into sequences ---------------- #
+def collapse(uploads, timer):
+    """
+    uploads: list of (filename, file_bytes, file_hash), photos and videos.
+    Returns (uploads to store, {file_hash: {"detections", "metadata", "sources"}} for
+    the representative frames, with the hashes of every file in their sequence,
+    filenames that could not be read). Photos whose sampled shots could not be
+    decoded are passed through unchanged for the normal path.
+    """
+    photos, videos, failed = [], [], []
+    for filename, file_bytes, file_hash in uploads:
+        if is_video(filename):
+            videos.append((filename, file_bytes, file_hash))
+        else:
+            with timer.stage("exif"):
+                photos.append((filename, file_bytes, read_exif(file_bytes), file_hash))
+
+    # Each sequence: (kind, source filenames, source hashes, frame count, [(name, bytes, frame, scale, file_hash)])
+    sequences = []
+    passthrough = []
+    clip_keys, clip_uploads = {}, []
+    bursts = group_bursts(photos)
+    picks = [[burst[i] for i in sample_indices(len(burst))] for burst in bursts]
+    decoded = iter(list(_executor.map(lambda photo: _decode_photo(photo, timer), [p for ps in picks for p in ps])))
+    for burst, burst_picks in zip(bursts, picks):
+        samples = []
+        for name, data, _, file_hash in burst_picks:
+            frame, scale = next(decoded)
+            if frame is not None:
+                samples.append((name, data, frame, scale, file_hash))
+        if samples:
+            sequences.append(("burst", [p[0] for p in burst], [p[3] for p in burst], len(burst), samples))
+        else:
+            passthrough += [(p[0], p[1]) for p in burst]
+
+    for filename, file_bytes, clip_hash in videos:
+        count, frames = _video_frames(filename, file_bytes, timer)
+        if not frames:
+            failed.append(filename)
+            continue
+        stem = os.path.splitext(filename)[0]
+        samples = [(f"{stem}_f{i}.jpg", data, frame, scale, hashlib.md5(data).hexdigest())
+                   for i, (data, frame, scale) in enumerate(frames)]
+        if SEQUENCE_STORE_CLIPS:
+            key = object_key(clip_hash, filename)
+            clip_keys[filename] = key
+            clip_uploads.append(put_async(key, file_bytes))
+        sequences.append(("video", [filename], [clip_hash], count, samples))
+
+    # Photo samples already seen with this model skip inference, as in the normal path
+    with timer.stage("result_cache"):
+        cached = result_cache.get_many([s[4] for kind, _, _, _, samples in sequences if kind == "burst"
+                                        for s in samples])
+    todo = [s for *_, samples in sequences for s in samples if s[4] not in cached]
+    if todo:
+        with timer.stage("inference"):
+            predicted = predict_frames([s[2] for s in todo])
+        fresh = {s[4]: to_full_resolution(d, s[3]) for s, d in zip(todo, predicted)}
+        with timer.stage("result_cache"):
+            result_cache.put_many({h: d for h, d in fresh.items() if h not in cached})
+        cached.update(fresh)
+
+    keep, known = [], {}
+    sampled = 0
+    for kind, sources, source_hashes, count, samples in sequences:
+        sampled += len(samples)
+        frame_detections = [cached[s[4]] for s in samples]
+        best, tracks = representative(frame_detections)
+        name, data, _, _, file_hash = samples[best]
+        keep.append((name, data))
+        info = {"kind": kind, "frames": count, "sampled": len(samples), "sources": sources[:100], "tracks": tracks}
+        if kind == "video" and sources[0] in clip_keys:
+            info["clip_key"] = clip_keys[sources[0]]
+        known[file_hash] = {"detections": frame_detections[best], "metadata": info,
+                            "sources": source_hashes}
+
+    # Rows must not point at clips that failed to store
+    with timer.stage("storage_wait"):
+        for future in clip_uploads:
+            future.result()
+
+    logger.info("Sequence mode: %d file(s) -> %d sequence(s), %d frame(s) sampled, %d passed through",
+                len(uploads), len(sequences), sampled, len(passthrough))
+    return keep + passthrough, known, failed
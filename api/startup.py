@@ -0,0 +1,116 @@
+import threading
+import time
+
+from .config import (
+    logger, STORAGE_BACKEND, STARTUP_TIMINGS, INFERENCE_SERVER_ADDRESS,
+    RESULT_CACHE_ENABLED, get_model, get_gcs_bucket, record_startup
+)
+from . import db, result_cache
+
+RETRY_BACKOFF_MIN = 5    # seconds before a failed component is checked again
+RETRY_BACKOFF_MAX = 120  # doubling up to this while it keeps failing
+
+_state = {"started": False, "warmed_up": False, "ready": False, "errors": {}, "retrying": False,
+          "retry_at": 0.0, "backoff": RETRY_BACKOFF_MIN}
+_lock = threading.Lock()
+
+
+# ---------------- Components ---------------- #
+def _check_model():
+    if INFERENCE_SERVER_ADDRESS:
+        # The model lives in the inference server; just make sure it answers
+        from .inference_server import ping
+        t = time.perf_counter()
+        ping()
+        record_startup("inference_server", t)
+    elif get_model() is None:  # loads, compiles and warms up the model
+        raise RuntimeError("model failed to load")
+
+
+def _check_gcs():
+    get_gcs_bucket()
+
+
+def _check_db():
+    t = time.perf_counter()
+    db.get_pool("detection").get_connection().close()
+    record_startup("db_pool", t)
+
+
+def _checks():
+    checks = {"model": _check_model}
+    if STORAGE_BACKEND == "gcs":
+        checks["gcs"] = _check_gcs
+    checks["db"] = _check_db
+    return checks
+
+
+def _run(names):
+    checks = _checks()
+    for name in names:
+        try:
+            checks[name]()
+            _state["errors"].pop(name, None)
+        except Exception as e:
+            logger.error("Warm-up of %s failed: %s", name, e)
+            _state["errors"][name] = str(e)
+
+
+# ---------------- Warm-up ---------------- #
+def warm_up():
+    """Bring up everything a first request would otherwise pay for, timing each component."""
+    started = time.perf_counter()
+    _run(["model"])
+
+    if RESULT_CACHE_ENABLED:
+        t = time.perf_counter()
+        result_cache.fingerprint()  # hashes the model files once
+        record_startup("result_cache", t)
+
+    _run([name for name in _checks() if name != "model"])
+    record_startup("warm_up", started)
+    logger.info("Startup timings (ms): %s", STARTUP_TIMINGS)
+    _state["ready"] = not _state["errors"]
+    _state["retry_at"] = time.monotonic() + _state["backoff"]
+    _state["warmed_up"] = True
+
+
+def warm_up_async():
+    with _lock:
+        if _state["started"]:
+            return
+        _state["started"] = True
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def _retry():
+    try:
+        _run(list(_state["errors"]))
+        _state["ready"] = not _state["errors"]
+        if _state["errors"]:
+            _state["backoff"] = min(_state["backoff"] * 2, RETRY_BACKOFF_MAX)
+        else:
+            _state["backoff"] = RETRY_BACKOFF_MIN
+            logger.info("Warm-up recovered, ready")
+        _state["retry_at"] = time.monotonic() + _state["backoff"]
+    finally:
+        _state["retrying"] = False
+
+
+def readiness():
+    """
+    (ready, details). Without a background warm-up everything is lazy, so we're always
+    ready. Failed components are checked again in the background, with backoff, when
+    the readiness probe asks after the retry time has passed.
+    """
+    if not _state["started"]:
+        return True, {"status": "ready", "warm_up": "disabled", "startup_ms": STARTUP_TIMINGS}
+    with _lock:
+        retry = (_state["warmed_up"] and _state["errors"] and not _state["retrying"]
+                 and time.monotonic() >= _state["retry_at"])
+        if retry:
+            _state["retrying"] = True
+    if retry:
+        threading.Thread(target=_retry, name="warm-up-retry", daemon=True).start()
+    status = "ready" if _state["ready"] else ("failed" if _state["errors"] else "warming_up")
+    return _state["ready"], {"status": status, "errors": dict(_state["errors"]), "startup_ms": STARTUP_TIMINGS}
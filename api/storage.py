@@ -0,0 +1,145 @@
+import mimetypes
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+from .metrics import STORAGE_SECONDS
+from .config import (
+    UPLOAD_DIR, STORAGE_BACKEND, get_gcs_bucket, GCS_UPLOAD_DIR,
+    STORAGE_UPLOAD_WORKERS, GCS_CHUNK_SIZE, GCS_SIGNED_URL_TTL
+)
+
+# Uploads run here so they overlap decode/inference of the rest of the batch
+_upload_executor = ThreadPoolExecutor(max_workers=STORAGE_UPLOAD_WORKERS, thread_name_prefix="storage")
+
+
+def object_key(file_hash, filename):
+    """Content-addressed name: same bytes -> same object, whoever uploads them and whatever they call them."""
+    ext = os.path.splitext(filename)[1].lower()
+    return f"{file_hash}{ext}"
+
+
+def content_type(key):
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+# ---------------- Local filesystem ---------------- #
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        # Keys are hashes or legacy filenames; never let one escape the upload dir
+        return os.path.join(self.root, os.path.basename(key))
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, key, data):
+        """Write the original bytes. Returns False if the object already existed."""
+        path = self.path(key)
+        if os.path.exists(path):
+            return False
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+
+    def get(self, key):
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key):
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# ---------------- Google Cloud Storage ---------------- #
+class GCSStorage:
+    name = "gcs"
+
+    def __init__(self, prefix):
+        # Imported here so the local backend runs without the google client installed
+        from google.api_core import exceptions
+        self.prefix = prefix
+        self.errors = exceptions
+
+    @property
+    def bucket(self):
+        return get_gcs_bucket()  # connects on first use
+
+    def blob(self, key):
+        blob = self.bucket.blob(self.prefix + key)
+        blob.chunk_size = GCS_CHUNK_SIZE  # files above the multipart limit go up as resumable chunks
+        return blob
+
+    def exists(self, key):
+        return self.blob(key).exists()
+
+    def put(self, key, data):
+        """Stream the original bytes; if_generation_match=0 makes 'already stored' a cheap 412."""
+        try:
+            self.blob(key).upload_from_file(BytesIO(data), size=len(data), content_type=content_type(key),
+                                            if_generation_match=0)
+        except self.errors.PreconditionFailed:
+            return False
+        return True
+
+    def get(self, key):
+        try:
+            return self.blob(key).download_as_bytes()
+        except self.errors.NotFound:
+            raise FileNotFoundError(key)
+
+    def delete(self, key):
+        try:
+            self.blob(key).delete()
+        except self.errors.NotFound:
+            pass
+
+    def signed_urls(self, keys):
+        """{key: V4 signed GET URL}; one bucket lookup and one expiry for the whole list."""
+        bucket = self.bucket
+        expiration = datetime.now(timezone.utc) + timedelta(seconds=GCS_SIGNED_URL_TTL)
+        return {
+            key: bucket.blob(self.prefix + key).generate_signed_url(version="v4", expiration=expiration, method="GET")
+            for key in keys
+        }
+
+    def signed_url(self, key):
+        return self.signed_urls([key])[key]
+
+
+if STORAGE_BACKEND == "gcs":
+    storage = GCSStorage(GCS_UPLOAD_DIR)
+else:
+    storage = LocalStorage(UPLOAD_DIR)
+
+
+def _timed_put(key, data):
+    start = time.perf_counter()
+    try:
+        return storage.put(key, data)
+    finally:
+        STORAGE_SECONDS.observe(time.perf_counter() - start, storage.name, "put")
+
+
+def put_async(key, data):
+    return _upload_executor.submit(_timed_put, key, data)
+
+
+def delete_async(key):
+    return _upload_executor.submit(storage.delete, key)
@@ -0,0 +1,144 @@
+import glob
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from .config import (
+    logger, THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_MB, THUMBNAIL_SIZES,
+    THUMBNAIL_MAX_WIDTH, THUMBNAIL_JPEG_QUALITY, THUMBNAIL_PREGENERATE
+)
+from .storage import storage
+
+CONTENT_KEY = re.compile(r"^[0-9a-f]{32}\.[a-z0-9]+$")  # keys named after their md5, see storage.object_key
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbnails")
+_lock = threading.Lock()
+_cache_bytes = None  # lazily measured total size of the cache dir
+
+os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+
+
+def parse_width(args):
+    """Requested variant width from ?size=<name> or ?w=<px>; None means the original."""
+    if args.get("size"):
+        if args["size"] not in THUMBNAIL_SIZES:
+            raise ValueError(f"Unknown size '{args['size']}', use one of {sorted(THUMBNAIL_SIZES)}")
+        return THUMBNAIL_SIZES[args["size"]]
+    if args.get("w"):
+        width = int(args["w"])
+        if not 16 <= width <= THUMBNAIL_MAX_WIDTH:
+            raise ValueError(f"w must be between 16 and {THUMBNAIL_MAX_WIDTH}")
+        return width
+    return None
+
+
+def variant_path(key, width):
+    stem = os.path.splitext(os.path.basename(key))[0]
+    return os.path.join(THUMBNAIL_CACHE_DIR, f"{stem}_w{width}.jpg")
+
+
+def etag_for(key, width=None):
+    """Strong ETag for content-addressed keys (their bytes never change); None lets Flask derive one."""
+    if not CONTENT_KEY.match(os.path.basename(key)):
+        return None
+    stem = os.path.splitext(os.path.basename(key))[0]
+    return f"{stem}-w{width}" if width else stem
+
+
+# ---------------- Generation ---------------- #
+def _render(data, width):
+    img = Image.open(BytesIO(data))
+    # JPEG: let libjpeg downscale in the DCT instead of decoding full resolution
+    img.draft("RGB", (width, width))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    if img.width > width:
+        img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+    out = BytesIO()
+    img.save(out, "JPEG", quality=THUMBNAIL_JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def _write(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=THUMBNAIL_CACHE_DIR, prefix=".variant-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _account(len(data))
+
+
+def get_variant(key, width, data=None):
+    """Path to the cached width-px variant of a stored object, generating it on a miss."""
+    path = variant_path(key, width)
+    if os.path.exists(path):
+        os.utime(path)  # LRU: mtime is "last used"
+        return path
+
+    if data is None:
+        data = storage.get(key)
+    _write(path, _render(data, width))
+    return path
+
+
+def pregenerate_async(key, data):
+    """Build the THUMBNAIL_PREGENERATE sizes in the background from bytes we already hold."""
+    def run():
+        for name in THUMBNAIL_PREGENERATE:
+            try:
+                get_variant(key, THUMBNAIL_SIZES[name], data=data)
+            except Exception as e:
+                logger.warning("Could not pre-generate %s variant of %s: %s", name, key, e)
+
+    if THUMBNAIL_PREGENERATE:
+        _executor.submit(run)
+
+
+def discard_async(key):
+    """Drop the cached variants of a deleted object in the background."""
+    def run():
+        stem = os.path.splitext(os.path.basename(key))[0]
+        for path in glob.glob(os.path.join(THUMBNAIL_CACHE_DIR, f"{glob.escape(stem)}_w*.jpg")):
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                _account(-size)
+            except FileNotFoundError:
+                pass
+
+    _executor.submit(run)
+
+
+# ---------------- LRU eviction ---------------- #
+def _entries():
+    with os.scandir(THUMBNAIL_CACHE_DIR) as it:
+        return [(e.stat().st_mtime, e.stat().st_size, e.path) for e in it if e.is_file() and not e.name.startswith(".")]
+
+
+def _account(added):
+    global _cache_bytes
+    limit = THUMBNAIL_CACHE_MAX_MB * 1024 * 1024
+    with _lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in _entries())
+        else:
+            _cache_bytes += added
+        if _cache_bytes <= limit:
+            return
+
+        # Evict least recently used down to 90% of the cap so we don't evict on every write
+        entries = sorted(_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= limit * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        _cache_bytes = total
+        logger.info("Thumbnail cache evicted down to %.1f MB", total / 1024 / 1024)
@@ -0,0 +1,44 @@
+"""
+Browser URLs for stored images, whichever storage backend is active.
+
+Local storage (and every resized variant) is served by detection.serve_upload.
+GCS originals get V4 signed URLs. Signing is an RSA operation per URL, so signed
+URLs are kept in memory and reused until SIGNED_URL_REFRESH_MARGIN seconds before
+they expire, and a page of keys is resolved with one call that signs only the misses.
+"""
+from flask import url_for
+
+from .config import GCS_SIGNED_URL_TTL, SIGNED_URL_REFRESH_MARGIN, SIGNED_URL_CACHE_SIZE
+from .storage import storage, GCSStorage
+from .utils import TTLCache
+
+SERVE_ENDPOINT = "api.detection.serve_upload"
+
+_signed = TTLCache(max(GCS_SIGNED_URL_TTL - SIGNED_URL_REFRESH_MARGIN, 0), SIGNED_URL_CACHE_SIZE)
+
+
+def signed_urls(keys):
+    """{key: signed URL} for originals in the bucket; only keys not cached are signed."""
+    urls, missing = {}, []
+    for key in dict.fromkeys(keys):
+        url = _signed.get(key)
+        if url is None:
+            missing.append(key)
+        else:
+            urls[key] = url
+    if missing:
+        for key, url in storage.signed_urls(missing).items():
+            _signed.set(key, url)
+            urls[key] = url
+    return urls
+
+
+def image_urls(keys, size=None):
+    """{key: browser URL} for a page of stored objects, or for their `size` variants."""
+    if size is None and isinstance(storage, GCSStorage):
+        return signed_urls(keys)
+    return {key: url_for(SERVE_ENDPOINT, filename=key, size=size, _external=True) for key in dict.fromkeys(keys)}
+
+
+def image_url(key, size=None):
+    return image_urls([key], size)[key]
@@ -1,23 +1,79 @@
-from .config import logger
-from io import BytesIO  
-from PIL import Image, ExifTags   # for metadata
-# Helper: extract EXIF metadata
-def extract_metadata(file_bytes):
-    try:
-        img = Image.open(BytesIO(file_bytes))
-        exif_data = img._getexif()
-        if not exif_data:
-            return {}
-        metadata = {}
-        for tag_id, value in exif_data.items():
-            tag = ExifTags.TAGS.get(tag_id, tag_id)
-            if isinstance(value, bytes):
-                try:
-                    value = value.decode()
-                except Exception:
-                    value = str(value)
-            metadata[tag] = value
-        return metadata
-    except Exception as e:
-        logger.warning("No metadata extracted: %s", str(e))
-        return {}
+import threading
+import time
+
+
+# Helper: one walk over the JPEG marker segments, without decoding anything
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+EXIF_HEADER = b"Exif\x00\x00"
+
+
+def scan_jpeg(file_bytes):
+    """
+    ((width, height) from the SOF segment, EXIF payload from APP1) -- either may be
+    None, both are None if this isn't a readable JPEG.
+    """
+    size = exif = None
+    if file_bytes[:2] != b"\xff\xd8":
+        return size, exif
+    i, n = 2, len(file_bytes)
+    while i + 4 <= n and size is None:
+        if file_bytes[i] != 0xFF:
+            break
+        marker = file_bytes[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # markers without a length
+            i += 2
+            continue
+        if marker == 0xDA:  # start of scan: no more headers
+            break
+        length = int.from_bytes(file_bytes[i + 2:i + 4], "big")
+        if marker == 0xE1 and exif is None and file_bytes[i + 4:i + 10] == EXIF_HEADER:
+            exif = file_bytes[i + 10:i + 2 + length]
+        elif marker in SOF_MARKERS and i + 9 <= n:
+            height = int.from_bytes(file_bytes[i + 5:i + 7], "big")
+            width = int.from_bytes(file_bytes[i + 7:i + 9], "big")
+            size = (width, height)
+        i += 2 + length
+    return size, exif
+
+
+def jpeg_size(file_bytes):
+    """(width, height) as stored in the SOF segment, or None if this isn't a readable JPEG."""
+    return scan_jpeg(file_bytes)[0]
+
+
+# Small in-process cache with per-entry expiry
+class TTLCache:
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                # Drop expired entries first, then the oldest insertions
+                now = time.monotonic()
+                for k in [k for k, (_, exp) in self._data.items() if exp < now]:
+                    del self._data[k]
+                while len(self._data) >= self.max_entries:
+                    del self._data[next(iter(self._data))]
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
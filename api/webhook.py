@@ -1,47 +1,44 @@
 from flask import Blueprint, request, jsonify
-import json
-import mysql.connector
-from .config import logger,DB_CONFIG, SHOPIFY_STORE, SHOPIFY_ACCESS_TOKEN  # import from config
+import base64
+import hashlib
+import hmac
+from .config import logger, ENV, SHOPIFY_WEBHOOK_SECRET  # import from config
+from . import webhook_queue
 
 webhook_bp = Blueprint("webhook", __name__)
 
-# ---------------- DB Connection ---------------- #
-try:
-    db = mysql.connector.connect(**DB_CONFIG)
-    cursor = db.cursor()
-    logger.info("Connected to MySQL database successfully.")
-except Exception as e:
-    logger.error(f"Database connection failed: {e}")
-    raise
+
+def _verified():
+    """Shopify signs the raw body: base64(HMAC-SHA256(secret, body)) in X-Shopify-Hmac-Sha256."""
+    if not SHOPIFY_WEBHOOK_SECRET:
+        return ENV == "DEV"
+    expected = base64.b64encode(
+        hmac.new(SHOPIFY_WEBHOOK_SECRET.encode(), request.get_data(), hashlib.sha256).digest()
+    ).decode()
+    return hmac.compare_digest(expected, request.headers.get("X-Shopify-Hmac-Sha256", ""))
 
 
 # ---------------- Webhook: New or updated customer ---------------- #
+# Acknowledged as soon as it is queued; webhook_queue writes the upserts in batches
 @webhook_bp.route("/customers", methods=["POST"])
 def customers_webhook():
-    try:
-        data = request.get_json()
-        logger.info(f"Webhook received: {json.dumps(data)}")
-
-        #  Insert only the required fields
-        sql = """
-        INSERT INTO customers (shopify_id, email, first_name, last_name)
-        VALUES (%s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-            first_name = VALUES(first_name),
-            last_name = VALUES(last_name),
-            updated_at = CURRENT_TIMESTAMP
-        """
-        values = (
-            data["id"],
-            data.get("email"),
-            data.get("first_name"),
-            data.get("last_name"),
-        )
-        cursor.execute(sql, values)
-        db.commit()
-        logger.info(f"Customer {data.get('email')} added or updated successfully.") 
-        return "ok", 200
-
-    except Exception as e:
-        logger.error(f"Error processing webhook: {e}")
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+    if not _verified():
+        logger.warning("Rejected customers webhook with a bad or missing HMAC")
+        return jsonify({"status": "error", "message": "Invalid webhook signature"}), 401
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or "id" not in data:
+        return jsonify({"status": "error", "message": "Expected a customer payload with an id"}), 400
+
+    webhook_id = request.headers.get("X-Shopify-Webhook-Id")
+    if webhook_queue.enqueue(webhook_id, data):
+        logger.debug("Queued customer %s (webhook %s)", data["id"], webhook_id)
+    else:
+        logger.debug("Duplicate webhook %s ignored", webhook_id)
+    return "ok", 200
+
+
+# Queue depth, flush rate and spill state for this process
+@webhook_bp.route("/stats", methods=["GET"])
+def webhook_stats():
+    return jsonify(webhook_queue.stats()), 200
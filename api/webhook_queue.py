@@ -0,0 +1,350 @@
+"""
+Buffered customer upserts for the Shopify webhook. The endpoint only verifies,
+deduplicates and queues; a flusher thread writes the queue to MySQL in multi-row
+upserts every WEBHOOK_FLUSH_INTERVAL seconds, or as soon as WEBHOOK_BATCH_SIZE rows
+are waiting. Events for the same customer collapse to the newest one, and the upsert
+never replaces a row with an older Shopify updated_at.
+
+Delivery ids are deduplicated in memory per process, then across processes at flush
+time through the webhook_deliveries table, in the same transaction as the upsert.
+
+Rows still queued at shutdown, or past WEBHOOK_QUEUE_MAX while the database is
+unreachable, are spilled to JSON-lines files under WEBHOOK_SPILL_DIR. Any process's
+flusher picks those files up again (claiming them by rename) once it has room.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from . import db, metrics
+from .config import (
+    logger, WEBHOOK_BATCH_SIZE, WEBHOOK_FLUSH_INTERVAL, WEBHOOK_DEDUP_TTL, WEBHOOK_DEDUP_MAX,
+    WEBHOOK_QUEUE_MAX, WEBHOOK_SPILL_DIR
+)
+from .utils import TTLCache
+
+# MySQL applies the assignments in order, so shopify_updated_at must stay last. A NULL
+# on either side compares as unknown: only an unknown stored time is overwritten.
+_NEWER = "COALESCE(VALUES(shopify_updated_at) >= shopify_updated_at, shopify_updated_at IS NULL)"
+UPSERT_SQL = f"""
+    INSERT INTO customers (shopify_id, email, first_name, last_name, shopify_updated_at)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        first_name = CASE WHEN {_NEWER} THEN VALUES(first_name) ELSE first_name END,
+        last_name = CASE WHEN {_NEWER} THEN VALUES(last_name) ELSE last_name END,
+        updated_at = CASE WHEN {_NEWER} THEN CURRENT_TIMESTAMP ELSE updated_at END,
+        shopify_updated_at = CASE WHEN {_NEWER} THEN VALUES(shopify_updated_at) ELSE shopify_updated_at END
+"""
+DELIVERY_SQL = "INSERT IGNORE INTO webhook_deliveries (webhook_id, flush_token, received_at) VALUES (%s, %s, %s)"
+RETRY_BACKOFF_MAX = 60  # seconds between flush attempts while the database is down
+RATE_WINDOW = 60        # seconds of flushes behind rows_per_second
+
+_seen = TTLCache(WEBHOOK_DEDUP_TTL, WEBHOOK_DEDUP_MAX)
+_pending = {}  # shopify_id -> row dict, insertion order = arrival order
+_lock = threading.Lock()
+_flush_lock = threading.Lock()  # one flush at a time, so the shutdown flush waits for the flusher's
+_wakeup = threading.Event()
+_flusher = None
+_claimed = []  # spill files loaded into _pending, removed once their rows are written
+_recent_flushes = deque()  # (monotonic time, rows)
+_stats = {"received": 0, "duplicates": 0, "flushed_rows": 0, "flushes": 0, "flush_errors": 0,
+          "spilled_rows": 0, "reloaded_rows": 0, "last_flush_at": None, "last_error": None}
+
+RECEIVED = metrics.counter("webhook_events_total", "Shopify customer webhooks by outcome", ("outcome",))
+FLUSHED_ROWS = metrics.counter("webhook_flushed_rows_total", "Customer rows written by the webhook flusher")
+FLUSH_SECONDS = metrics.histogram("webhook_flush_duration_seconds", "Time per webhook flush (all batches)")
+metrics.gauge("webhook_queue_depth", "Customer rows waiting for the next flush", lambda: len(_pending))
+
+
+# ---------------- Queue ---------------- #
+def enqueue(webhook_id, payload):
+    """Queue one customers/create|update payload. False if this delivery was already seen."""
+    if webhook_id and _seen.get(webhook_id):
+        with _lock:
+            _stats["duplicates"] += 1
+        RECEIVED.inc("duplicate")
+        return False
+
+    row = {
+        "shopify_id": payload["id"],
+        "email": payload.get("email"),
+        "first_name": payload.get("first_name"),
+        "last_name": payload.get("last_name"),
+        "updated_at": payload.get("updated_at"),
+        "webhook_id": webhook_id,
+    }
+    if webhook_id:
+        _seen.set(webhook_id, True)
+    start()
+    with _lock:
+        _merge(row)
+        _stats["received"] += 1
+        depth = len(_pending)
+    RECEIVED.inc("queued")
+    if depth >= WEBHOOK_BATCH_SIZE:
+        _wakeup.set()
+    return True
+
+
+def _updated_at(row):
+    """updated_at as an aware datetime; missing or unparseable sorts oldest."""
+    try:
+        parsed = datetime.fromisoformat(row.get("updated_at").replace("Z", "+00:00"))
+    except (AttributeError, TypeError, ValueError):
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _updated_at_utc(row):
+    """updated_at as a naive UTC datetime for the shopify_updated_at column, or None."""
+    parsed = _updated_at(row)
+    if parsed == datetime.min.replace(tzinfo=timezone.utc):
+        return None
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _merge(row):
+    # Caller holds _lock. Shopify doesn't guarantee delivery order, so keep the newer update
+    # (compared as instants: shops send local offsets, which don't order as strings)
+    current = _pending.get(row["shopify_id"])
+    if current is None or _updated_at(row) >= _updated_at(current):
+        _pending[row["shopify_id"]] = row
+
+
+def _take():
+    global _pending
+    with _lock:
+        rows, _pending = _pending, {}
+    return rows
+
+
+def _restore(rows):
+    # Anything that arrived meanwhile for the same customer is at least as new
+    with _lock:
+        for row in rows:
+            if row["shopify_id"] not in _pending:
+                _pending[row["shopify_id"]] = row
+
+
+def stats():
+    now = time.monotonic()
+    with _lock:
+        depth = len(_pending)
+        recent = sum(rows for at, rows in _recent_flushes if now - at <= RATE_WINDOW)
+    return {**_stats, "queue_depth": depth, "rows_per_second": round(recent / RATE_WINDOW, 2),
+            "spill_files": len(_spill_files())}
+
+
+# ---------------- Flusher ---------------- #
+def flush():
+    """Write everything queued. On failure the unwritten rows go back on the queue."""
+    with _flush_lock:
+        return _flush()
+
+
+def _flush():
+    rows = list(_take().values())
+    if not rows:
+        _drop_claimed()
+        return 0
+    done = written = duplicates = 0  # done: rows dealt with, written or skipped as already delivered
+    start = time.perf_counter()
+    try:
+        conn, cursor = db.get_db("webhook", dictionary=False)
+        try:
+            for i in range(0, len(rows), WEBHOOK_BATCH_SIZE):
+                chunk = rows[i:i + WEBHOOK_BATCH_SIZE]
+                batch = _first_deliveries(cursor, chunk)
+                # executemany folds a plain INSERT ... VALUES into one multi-row statement
+                if batch:
+                    cursor.executemany(UPSERT_SQL, [(r["shopify_id"], r["email"], r["first_name"], r["last_name"],
+                                                     _updated_at_utc(r)) for r in batch])
+                conn.commit()
+                done += len(chunk)
+                written += len(batch)
+                duplicates += len(chunk) - len(batch)
+            _prune_deliveries(cursor)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+    except Exception:
+        _restore(rows[done:])
+        raise
+    finally:
+        if duplicates:
+            RECEIVED.inc("duplicate", n=duplicates)
+            with _lock:
+                _stats["duplicates"] += duplicates
+        if written:
+            FLUSH_SECONDS.observe(time.perf_counter() - start)
+            FLUSHED_ROWS.inc(n=written)
+            with _lock:
+                _recent_flushes.append((time.monotonic(), written))
+                while _recent_flushes and time.monotonic() - _recent_flushes[0][0] > RATE_WINDOW:
+                    _recent_flushes.popleft()
+                _stats["flushed_rows"] += written
+                _stats["flushes"] += 1
+                _stats["last_flush_at"] = time.time()
+    _drop_claimed()
+    return written
+
+
+def _first_deliveries(cursor, batch):
+    """
+    The rows of batch whose delivery no process has written yet; records their ids in
+    the caller's transaction. Concurrent flushers of the same id wait on its key, so
+    exactly one of them sees the id under its own token.
+    """
+    ids = sorted({r["webhook_id"] for r in batch if r.get("webhook_id")})
+    if not ids:
+        return batch
+    token = uuid.uuid4().hex
+    received_at = datetime.utcnow()
+    cursor.executemany(DELIVERY_SQL, [(webhook_id, token, received_at) for webhook_id in ids])
+    cursor.execute("SELECT webhook_id FROM webhook_deliveries WHERE flush_token = %s", (token,))
+    ours = {row[0] for row in cursor.fetchall()}
+    return [r for r in batch if not r.get("webhook_id") or r["webhook_id"] in ours]
+
+
+def _prune_deliveries(cursor):
+    cursor.execute("DELETE FROM webhook_deliveries WHERE received_at < %s",
+                   (datetime.utcnow() - timedelta(seconds=WEBHOOK_DEDUP_TTL),))
+
+
+def _flush_loop():
+    backoff = WEBHOOK_FLUSH_INTERVAL
+    while True:
+        _wakeup.wait(backoff)
+        _wakeup.clear()
+        try:
+            flush()
+            backoff = WEBHOOK_FLUSH_INTERVAL
+            if len(_pending) < WEBHOOK_BATCH_SIZE:
+                _reload_spill()
+        except Exception as e:
+            with _lock:
+                _stats["flush_errors"] += 1
+                _stats["last_error"] = str(e)
+            backoff = min(backoff * 2, RETRY_BACKOFF_MAX)
+            logger.error("Webhook flush failed, %d row(s) queued, retrying in %.1fs: %s", len(_pending), backoff, e)
+            if len(_pending) > WEBHOOK_QUEUE_MAX:
+                spill()
+
+
+def start():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is not None:
+            return
+        os.makedirs(WEBHOOK_SPILL_DIR, exist_ok=True)
+        _flusher = threading.Thread(target=_flush_loop, name="webhook-flusher", daemon=True)
+        _flusher.start()
+        atexit.register(shutdown)
+    _wakeup.set()  # first pass picks up anything spilled by an earlier run
+
+
+def shutdown():
+    """Last flush on interpreter exit; whatever can't be written is spilled to disk."""
+    try:
+        flush()
+    except Exception as e:
+        logger.error("Webhook flush at shutdown failed: %s", e)
+        spill()
+
+
+# ---------------- Spill files ---------------- #
+def _spill_files():
+    return glob.glob(os.path.join(WEBHOOK_SPILL_DIR, "*.jsonl"))
+
+
+def spill():
+    with _flush_lock:
+        _spill()
+
+
+def _spill():
+    rows = list(_take().values())
+    if not rows:
+        return
+    path = os.path.join(WEBHOOK_SPILL_DIR, f"customers-{os.getpid()}-{time.time_ns()}.jsonl")
+    with open(path + ".tmp", "w") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    # The rows from any file we had claimed now live in the new one
+    _drop_claimed()
+    with _lock:
+        _stats["spilled_rows"] += len(rows)
+    logger.warning("Spilled %d webhook row(s) to %s", len(rows), path)
+
+
+def _reload_spill():
+    """Claim and queue one spill file (or a file left claimed by a process that died)."""
+    # Under the flush lock: a flush running meanwhile (e.g. at shutdown) would otherwise
+    # drop the newly claimed file without having written its rows
+    with _flush_lock:
+        _reload_one()
+
+
+def _reload_one():
+    for path in _spill_files() + _orphaned_claims():
+        claimed = f"{path.split('.jsonl')[0]}.jsonl.claimed-{os.getpid()}"
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            continue  # another process got there first
+        try:
+            with open(claimed) as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            if not all(isinstance(row, dict) and "shopify_id" in row for row in rows):
+                raise ValueError("not customer rows")
+        except (OSError, ValueError) as e:
+            # Set aside for a look by hand, rather than held by this pid and retried forever
+            os.replace(claimed, f"{path.split('.jsonl')[0]}.jsonl.bad")
+            logger.error("Unreadable webhook spill file %s, moved aside as .bad: %s", os.path.basename(path), e)
+            continue
+        with _lock:
+            for row in rows:
+                _merge(row)
+            _claimed.append(claimed)
+            _stats["reloaded_rows"] += len(rows)
+        logger.info("Reloaded %d webhook row(s) from %s", len(rows), os.path.basename(path))
+        _wakeup.set()
+        return
+
+
+def _orphaned_claims():
+    orphans = []
+    for path in glob.glob(os.path.join(WEBHOOK_SPILL_DIR, "*.jsonl.claimed-*")):
+        pid = int(path.rsplit("-", 1)[1])
+        if pid == os.getpid():
+            continue
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            orphans.append(path)
+        except PermissionError:
+            pass
+    return orphans
+
+
+def _drop_claimed():
+    with _lock:
+        claimed = list(_claimed)
+        _claimed.clear()
+    for path in claimed:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,97 @@
+"""
+Rows/sec for detection inserts: one INSERT per row (old process_images) vs one
+executemany per batch (current process_images).
+
+    python -m benchmarks.bench_db_insert                 # MySQL from DB_CONFIG, temporary table
+    python -m benchmarks.bench_db_insert --sqlite --rtt-ms 0.5
+
+The SQLite stand-in has no network, so --rtt-ms adds a simulated round trip per
+statement sent to the server.
+"""
+import argparse
+import json
+import random
+import sqlite3
+import time
+
+CREATE_SQL = """
+    CREATE TEMPORARY TABLE bench_user_detections (
+        id INTEGER PRIMARY KEY {autoinc},
+        user_id VARCHAR(64) NOT NULL,
+        image_name VARCHAR(255) NOT NULL,
+        detected_class VARCHAR(64) NOT NULL,
+        confidence FLOAT NOT NULL,
+        bbox TEXT
+    )
+"""
+INSERT_SQL = """
+    INSERT INTO bench_user_detections (user_id, image_name, detected_class, confidence, bbox)
+    VALUES ({p}, {p}, {p}, {p}, {p})
+"""
+
+
+def make_rows(count):
+    rng = random.Random(0)
+    return [
+        ("bench-user", f"IMG_{i // 8:04d}.JPG", "Deer", round(rng.random(), 4),
+         json.dumps([rng.randint(0, 2000) for _ in range(4)]))
+        for i in range(count)
+    ]
+
+
+def connect(use_sqlite):
+    if use_sqlite:
+        conn = sqlite3.connect(":memory:")
+        conn.execute(CREATE_SQL.format(autoinc="AUTOINCREMENT"))
+        return conn, "?"
+
+    import mysql.connector
+    from api.config import DB_CONFIG
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cur = conn.cursor()
+    cur.execute(CREATE_SQL.format(autoinc="AUTO_INCREMENT"))
+    cur.close()
+    return conn, "%s"
+
+
+def run(conn, sql, rows, bulk, rtt):
+    cur = conn.cursor()
+    start = time.perf_counter()
+    if bulk:
+        cur.executemany(sql, rows)
+        time.sleep(rtt)
+    else:
+        for row in rows:
+            cur.execute(sql, row)
+            time.sleep(rtt)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    cur.execute("DELETE FROM bench_user_detections")
+    conn.commit()
+    cur.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500, help="detection rows per request")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--sqlite", action="store_true", help="use an in-memory SQLite stand-in")
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="simulated round trip per statement")
+    args = parser.parse_args()
+
+    conn, placeholder = connect(args.sqlite)
+    sql = INSERT_SQL.format(p=placeholder)
+    rows = make_rows(args.rows)
+    rtt = args.rtt_ms / 1000
+
+    print(f"{'mode':>12} {'rows/sec':>12}")
+    for label, bulk in (("per-row", False), ("executemany", True)):
+        best = min(run(conn, sql, rows, bulk, rtt) for _ in range(args.repeats))
+        print(f"{label:>12} {len(rows) / best:>12.0f}")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Per-image decode time and peak memory: full-resolution cv2.imdecode vs. the
+reduced (DCT-scaled) decode api.pipeline uses for inference.
+
+    python -m benchmarks.bench_decode --images path/to/trailcam_jpgs
+
+Without --images, a synthetic 6000x4000 JPEG is used. Peak memory is measured with
+tracemalloc, which sees the decoded numpy frames but not libjpeg's scratch buffers.
+"""
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from api.config import MODEL_IMGSZ
+from api.pipeline import decode_frame, decode_factor
+from api.utils import jpeg_size
+
+
+def load_jpegs(folder):
+    paths = sorted(glob.glob(os.path.join(folder, "*.jp*g")) + glob.glob(os.path.join(folder, "*.JP*G")))
+    blobs = []
+    for p in paths:
+        with open(p, "rb") as f:
+            blobs.append(f.read())
+    if not blobs:
+        raise SystemExit(f"No JPEGs in {folder}")
+    return blobs
+
+
+def synthetic_jpeg(width=6000, height=4000):
+    # Smooth gradients + some noise: compresses like a photo, unlike pure noise
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.stack([(x + y) / 2, np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width))], axis=-1)
+    img = (img + rng.normal(0, 8, img.shape)).clip(0, 255).astype(np.uint8)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def measure(blobs, decode, repeats):
+    times, peaks, shapes = [], [], []
+    for data in blobs:
+        for _ in range(repeats):
+            tracemalloc.start()
+            start = time.perf_counter()
+            frame = decode(data)
+            times.append((time.perf_counter() - start) * 1000)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024 / 1024)
+            tracemalloc.stop()
+            shapes.append(frame.shape[:2])
+            del frame
+    return times, peaks, shapes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="folder of sample JPEGs")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    blobs = load_jpegs(args.images) if args.images else [synthetic_jpeg()]
+    sizes = [jpeg_size(b) for b in blobs]
+    print(f"{len(blobs)} JPEG(s), e.g. {sizes[0][0]}x{sizes[0][1]}, model input {MODEL_IMGSZ}px, "
+          f"reduce factor {decode_factor(sizes[0])}")
+
+    modes = {
+        "full": lambda data: cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR),
+        "reduced": lambda data: decode_frame(data, reduced=True)[0],
+    }
+    print(f"{'mode':>8} {'p50 ms':>8} {'p95 ms':>8} {'peak MB':>8} {'frame':>12}")
+    for name, decode in modes.items():
+        times, peaks, shapes = measure(blobs, decode, args.repeats)
+        h, w = shapes[0]
+        print(f"{name:>8} {np.percentile(times, 50):>8.1f} {np.percentile(times, 95):>8.1f} "
+              f"{np.mean(peaks):>8.1f} {f'{w}x{h}':>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Images/sec of api.inference.predict_frames at different micro-batch sizes.
+
+    python -m benchmarks.bench_inference --images path/to/trailcam_jpgs --batch-sizes 1 8 32
+
+Without --images, random 1920x1080 frames are used (fine for throughput, not for accuracy).
+"""
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from api.inference import predict_frames, effective_batch_size
+
+
+def load_frames(folder, count):
+    paths = sorted(glob.glob(os.path.join(folder, "*")))
+    frames = [f for f in (cv2.imread(p) for p in paths) if f is not None]
+    if not frames:
+        raise SystemExit(f"No readable images in {folder}")
+    # Repeat the sample so every run sees the same number of frames
+    return [frames[i % len(frames)] for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="folder of sample images")
+    parser.add_argument("--count", type=int, default=32, help="frames per run (one upload batch)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.images:
+        frames = load_frames(args.images, args.count)
+    else:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, (1080, 1920, 3), dtype=np.uint8) for _ in range(args.count)]
+
+    predict_frames(frames[:1], batch_size=1)  # warm-up / compile
+
+    print(f"{'batch':>6} {'effective':>9} {'images/sec':>11}")
+    for batch_size in args.batch_sizes:
+        best = float("inf")
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            predict_frames(frames, batch_size=batch_size)
+            best = min(best, time.perf_counter() - start)
+        print(f"{batch_size:>6} {effective_batch_size(batch_size):>9} {len(frames) / best:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
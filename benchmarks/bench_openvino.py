@@ -0,0 +1,109 @@
+"""
+Sweep OpenVINO runtime settings on CPU and report per-image latency (p50/p95) and
+batch throughput for each combination, to pick settings per deployment size.
+
+    python -m benchmarks.bench_openvino --images path/to/trailcam_jpgs \\
+        --hints LATENCY THROUGHPUT --threads 0 2 4 --streams "" 2 --batch-sizes 1 8
+
+Every combination runs in a fresh subprocess because the settings are read from the
+environment when api.config is imported. Empty string / 0 means the runtime default.
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def run_worker(args):
+    """One settings combination, configured through the environment. Prints a JSON line."""
+    import cv2
+    from api.inference import predict_frames, effective_batch_size
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*")))
+    frames = [f for f in (cv2.imread(p) for p in paths[:args.limit]) if f is not None]
+    if not frames:
+        raise SystemExit(f"No readable images in {args.images}")
+
+    load_start = time.perf_counter()
+    predict_frames(frames[:1])  # loads, compiles and warms up the model
+    load_ms = (time.perf_counter() - load_start) * 1000
+
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        predict_frames([frame], batch_size=1)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    predict_frames(frames, batch_size=args.batch)
+    throughput = len(frames) / (time.perf_counter() - start)
+
+    print(json.dumps({
+        "load_ms": round(load_ms, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "images_per_sec": round(throughput, 2),
+        "effective_batch": effective_batch_size(args.batch),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="folder of sample images")
+    parser.add_argument("--limit", type=int, default=64, help="max images to use")
+    parser.add_argument("--hints", nargs="+", default=["LATENCY", "THROUGHPUT"])
+    parser.add_argument("--threads", nargs="+", default=["0"])
+    parser.add_argument("--streams", nargs="+", default=[""])
+    parser.add_argument("--precisions", nargs="+", default=[""], help="f32 / f16 / bf16")
+    parser.add_argument("--variants", nargs="+", default=[""], help="MODEL_VARIANT values, e.g. '' int8")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--output", help="also write all results to this JSON file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--batch", type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    rows = []
+    header = f"{'variant':>8} {'hint':>22} {'thr':>4} {'str':>5} {'prec':>5} {'batch':>5} " \
+             f"{'p50 ms':>8} {'p95 ms':>8} {'img/s':>8}"
+    print(header)
+    for variant, hint, threads, streams, precision, batch in itertools.product(
+            args.variants, args.hints, args.threads, args.streams, args.precisions, args.batch_sizes):
+        env = dict(os.environ, ENV="DEV", INFERENCE_SERVER_ADDRESS="", MODEL_VARIANT=variant,
+                   OV_DEVICE="CPU", OV_PERFORMANCE_HINT=hint, OV_NUM_THREADS=threads,
+                   OV_NUM_STREAMS=streams, OV_PRECISION_HINT=precision)
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_openvino", "--worker", "--images", args.images,
+             "--limit", str(args.limit), "--batch", str(batch)],
+            env=env, capture_output=True, text=True
+        )
+        settings = {"variant": variant, "hint": hint, "threads": threads, "streams": streams,
+                    "precision": precision, "batch": batch}
+        if proc.returncode != 0:
+            print(f"{variant or 'fp32':>8} {hint:>22} {threads:>4} {streams or '-':>5} {precision or '-':>5} "
+                  f"{batch:>5}  FAILED: {proc.stderr.strip().splitlines()[-1:]}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        rows.append({**settings, **result})
+        print(f"{variant or 'fp32':>8} {hint:>22} {threads:>4} {streams or '-':>5} {precision or '-':>5} "
+              f"{batch:>5} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['images_per_sec']:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
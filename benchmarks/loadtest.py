@@ -0,0 +1,446 @@
+"""
+End-to-end load test of create_app(), runnable offline. SQLite stands in for MySQL,
+storage is the local backend in a temp dir, and the detector is a stub with a fixed
+per-frame cost (--real-model uses the OpenVINO export instead).
+
+    python -m benchmarks.loadtest --concurrency 8 --requests 200
+    python -m benchmarks.loadtest --write-baseline benchmarks/baseline.json
+    python -m benchmarks.loadtest --baseline benchmarks/baseline.json --output run.json
+
+Scenarios (run in this order, over HTTP against a threaded local server):
+process-images, tagged-images, dashboard, webhook-customers. Each reports
+throughput, p50/p99 latency and the process's peak RSS so far. The client runs in
+the same process, so RSS includes it, which is small next to decoded frames.
+With --baseline, a scenario whose throughput drops or p99 grows by more than
+--tolerance, or that has more errors, fails the run (exit code 1).
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+
+import numpy as np
+
+SCENARIOS = ("process-images", "tagged-images", "dashboard", "webhook-customers")
+
+
+# ---------------- SQLite stand-in for mysql.connector ---------------- #
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id VARCHAR(64) NOT NULL,
+    file_hash CHAR(32) NOT NULL,
+    image_name VARCHAR(255) NOT NULL,
+    storage_key VARCHAR(255),
+    metadata TEXT,
+    camera VARCHAR(255),
+    captured_at DATETIME,
+    status VARCHAR(16) NOT NULL DEFAULT 'detected',
+    detection_count INTEGER NOT NULL DEFAULT 0,
+    clip_key VARCHAR(255),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (user_id, file_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_user_images_user_name ON user_images (user_id, image_name);
+CREATE INDEX IF NOT EXISTS idx_user_images_user_created ON user_images (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_user_images_storage_key ON user_images (storage_key);
+
+CREATE TABLE IF NOT EXISTS user_detections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    image_id INTEGER,
+    user_id VARCHAR(64) NOT NULL,
+    image_name VARCHAR(255) NOT NULL,
+    detected_class VARCHAR(64) NOT NULL,
+    confidence REAL NOT NULL,
+    bbox TEXT,
+    metadata TEXT,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_user_detections_user_image ON user_detections (user_id, image_name);
+CREATE INDEX IF NOT EXISTS idx_user_detections_image ON user_detections (image_id);
+
+CREATE TABLE IF NOT EXISTS user_image_sources (
+    user_id VARCHAR(64) NOT NULL,
+    file_hash CHAR(32) NOT NULL,
+    image_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, file_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_user_image_sources_image ON user_image_sources (image_id);
+
+CREATE TABLE IF NOT EXISTS user_detection_rollup (
+    user_id VARCHAR(64) NOT NULL,
+    detected_class VARCHAR(64) NOT NULL,
+    camera VARCHAR(255) NOT NULL DEFAULT '',
+    day DATE NOT NULL,
+    image_count INTEGER NOT NULL DEFAULT 0,
+    detection_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, detected_class, camera, day)
+);
+
+CREATE TABLE IF NOT EXISTS customers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    shopify_id BIGINT NOT NULL UNIQUE,
+    email VARCHAR(255),
+    first_name VARCHAR(255),
+    last_name VARCHAR(255),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    shopify_updated_at DATETIME
+);
+
+CREATE TABLE IF NOT EXISTS webhook_deliveries (
+    webhook_id VARCHAR(64) NOT NULL PRIMARY KEY,
+    flush_token CHAR(32) NOT NULL,
+    received_at DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_deliveries_token ON webhook_deliveries (flush_token);
+CREATE INDEX IF NOT EXISTS idx_webhook_deliveries_received ON webhook_deliveries (received_at);
+"""
+
+DUPLICATE_KEY = re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(.*)$", re.S | re.I)
+
+
+@lru_cache(maxsize=256)
+def translate(sql):
+    """The MySQL dialect the api uses -> SQLite: placeholders, upserts and locking reads."""
+    sql = sql.replace("%s", "?").replace("INSERT IGNORE", "INSERT OR IGNORE").replace(" FOR UPDATE", "")
+    match = DUPLICATE_KEY.search(sql)
+    if match:
+        assignments = re.sub(r"VALUES\((\w+)\)", r"excluded.\1", match.group(1)).strip()
+        action = "DO NOTHING" if re.fullmatch(r"id\s*=\s*id", assignments) else f"DO UPDATE SET {assignments}"
+        sql = sql[:match.start()] + "ON CONFLICT " + action
+    return sql
+
+
+class _Cursor:
+    def __init__(self, conn, dictionary):
+        self._cur = conn.cursor()
+        self.dictionary = dictionary
+
+    def execute(self, sql, params=()):
+        self._cur.execute(translate(sql), tuple(params or ()))
+
+    def executemany(self, sql, rows):
+        self._cur.executemany(translate(sql), rows)
+
+    def _row(self, row):
+        if row is None or not self.dictionary:
+            return row
+        return {d[0]: value for d, value in zip(self._cur.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    def close(self):
+        self._cur.close()
+
+
+class SQLiteConnection:
+    """The subset of a mysql.connector connection that api/db.py and the blueprints use."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+
+    def cursor(self, dictionary=False, buffered=False):
+        return _Cursor(self._conn, dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, **kwargs):
+        pass
+
+    def close(self):
+        self._conn.close()
+
+
+def init_sqlite(path):
+    sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+    sqlite3.register_adapter(date, lambda d: d.isoformat())
+    for decltype in ("TIMESTAMP", "DATETIME"):
+        sqlite3.register_converter(decltype, lambda b: datetime.fromisoformat(b.decode()))
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+
+# ---------------- Stub detector ---------------- #
+class _Array:
+    def __init__(self, values):
+        self.values = np.asarray(values)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class _Boxes:
+    def __init__(self, xyxy, cls, conf):
+        self.xyxy, self.cls, self.conf = _Array(xyxy), _Array(cls), _Array(conf)
+
+    def __len__(self):
+        return len(self.xyxy.values)
+
+
+class _Result:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubModel:
+    """Looks like an ultralytics model to api/inference.py: fixed cost, 0-2 boxes per frame."""
+    names = {0: "Deer", 1: "Buck", 2: "Doe"}
+
+    def __init__(self, ms_per_frame):
+        self.seconds = ms_per_frame / 1000
+
+    def predict(self, inputs, imgsz=640, verbose=False):
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        time.sleep(self.seconds * len(inputs))
+        results = []
+        for img in inputs:
+            n = int(img[::64, ::64].sum()) % 3
+            xyxy = np.array([[100 + 40 * i, 120, 260 + 40 * i, 300] for i in range(n)], np.float32).reshape(-1, 4)
+            results.append(_Result(_Boxes(xyxy, [i % 3 for i in range(n)], [0.5 + 0.1 * i for i in range(n)])))
+        return results
+
+
+# ---------------- App under test ---------------- #
+def start_app(workdir, args):
+    os.environ.update({
+        "ENV": "DEV", "DEV_STORAGE_BACKEND": "local", "WARMUP_ON_START": "0", "INFERENCE_SERVER_ADDRESS": "",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "THUMBNAIL_CACHE_DIR": os.path.join(workdir, "thumbnails"),
+        "JOBS_DB_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "RESULT_CACHE_PATH": os.path.join(workdir, "result_cache.sqlite3"),
+        "JOBS_SPOOL_DIR": os.path.join(workdir, "job_spool"),
+        "PROFILE_DIR": os.path.join(workdir, "profiles"),
+        "WEBHOOK_SPILL_DIR": os.path.join(workdir, "webhook_spill"),
+        "DB_POOL_SIZE": str(args.pool_size),
+    })
+    db_path = os.path.join(workdir, "loadtest.sqlite3")
+    init_sqlite(db_path)
+
+    from werkzeug.serving import make_server
+    from api import create_app, db, inference
+    from api.storage import storage
+
+    if storage.name != "local":
+        raise SystemExit("Storage resolved to a remote backend (check .env); the load test needs local storage")
+    db.ConnectionPool._connect = lambda pool: SQLiteConnection(db_path)
+    if not args.real_model:
+        stub = StubModel(args.model_ms)
+        inference.get_model = lambda: stub
+
+    if not args.verbose:
+        for name in ("WildlifeLogger", "ServerLogger", "werkzeug"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def sample_jpegs(count, width, height):
+    import cv2
+
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    blobs = []
+    for i in range(count):
+        img = np.stack([np.broadcast_to((x * (i + 1)) % 255, (height, width)),
+                        np.broadcast_to(y, (height, width)), (x + y) / 2], axis=-1)
+        img = (img + rng.normal(0, 6, img.shape)).clip(0, 255).astype(np.uint8)
+        blobs.append(cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return blobs
+
+
+# ---------------- HTTP client ---------------- #
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode()
+             for k, v in fields.items()]
+    for name, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def call(url, method="GET", data=None, headers=None):
+    req = urlrequest.Request(url, data=data, headers=headers or {}, method=method)
+    start = time.perf_counter()
+    try:
+        with urlrequest.urlopen(req, timeout=600) as resp:
+            resp.read()
+            status = resp.status
+    except HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = 0
+    return time.perf_counter() - start, status
+
+
+def scenarios(args, jpegs):
+    users = [f"loadtest-{i}" for i in range(args.users)]
+
+    def process_images(i):
+        # Trailing bytes after EOI make every upload a new file to the dedup check
+        files = [("images_batch", f"IMG_{i:05d}_{j}.JPG", jpegs[(i + j) % len(jpegs)] + uuid.uuid4().bytes)
+                 for j in range(args.images_per_request)]
+        body, headers = multipart({"user_id": users[i % len(users)]}, files)
+        return "POST", "/api/detection/process-images", body, headers
+
+    def tagged_images(i):
+        return "GET", f"/api/detection/user/{users[i % len(users)]}/tagged-images?limit=50", None, None
+
+    def dashboard(i):
+        return "GET", f"/api/analytics/user/{users[i % len(users)]}/dashboard", None, None
+
+    def webhook(i):
+        body = json.dumps({"id": 1000 + i % 500, "email": f"c{i % 500}@example.com",
+                           "first_name": "Load", "last_name": f"Test{i}"}).encode()
+        return "POST", "/api/webhook/customers", body, {"Content-Type": "application/json"}
+
+    return {
+        "process-images": (process_images, args.upload_requests),
+        "tagged-images": (tagged_images, args.requests),
+        "dashboard": (dashboard, args.requests),
+        "webhook-customers": (webhook, args.requests),
+    }
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # KiB on Linux
+
+
+def run_scenario(base_url, build, count, concurrency):
+    def one(i):
+        method, path, body, headers = build(i)
+        return call(base_url + path, method, body, headers)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(count)))
+    wall = time.perf_counter() - start
+
+    latencies = [seconds * 1000 for seconds, _ in results]
+    return {
+        "requests": count,
+        "errors": sum(1 for _, status in results if not 200 <= status < 300),
+        "throughput_rps": round(count / wall, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# ---------------- Baseline comparison ---------------- #
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, current in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            found.append(f"{name}: throughput {current['throughput_rps']} < baseline {base['throughput_rps']}")
+        if current["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            found.append(f"{name}: p99 {current['p99_ms']} ms > baseline {base['p99_ms']} ms")
+        if current["errors"] > base["errors"]:
+            found.append(f"{name}: {current['errors']} errors, baseline had {base['errors']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per read/webhook scenario")
+    parser.add_argument("--upload-requests", type=int, default=40, help="process-images requests")
+    parser.add_argument("--images-per-request", type=int, default=8)
+    parser.add_argument("--image-size", default="1920x1080", help="WIDTHxHEIGHT of the synthetic JPEGs")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=5, help="DB_POOL_SIZE for the app")
+    parser.add_argument("--model-ms", type=float, default=20, help="stub detector cost per frame")
+    parser.add_argument("--real-model", action="store_true", help="use the OpenVINO model instead of the stub")
+    parser.add_argument("--output", help="write this run's results to a JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file (exit 1 on regression)")
+    parser.add_argument("--write-baseline", help="write this run's results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative change vs. baseline")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO logging")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    with tempfile.TemporaryDirectory(prefix="buck-loadtest-") as workdir:
+        server, base_url = start_app(workdir, args)
+        jpegs = sample_jpegs(4, width, height)
+        plan = scenarios(args, jpegs)
+
+        results = {}
+        print(f"{'scenario':>18} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>8}")
+        for name in args.scenarios:
+            build, count = plan[name]
+            r = results[name] = run_scenario(base_url, build, count, args.concurrency)
+            print(f"{name:>18} {r['requests']:>6} {r['errors']:>6} {r['throughput_rps']:>8.2f} "
+                  f"{r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['peak_rss_mb']:>8.1f}")
+        server.shutdown()
+
+    run = {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "write_baseline", "verbose")},
+        "results": results,
+    }
+    for path in (args.output, args.write_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(run, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != run["config"]:
+            print("Note: baseline was recorded with different settings:", baseline.get("config"))
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print("REGRESSION", line)
+        if found:
+            sys.exit(1)
+        print(f"No regressions vs. {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
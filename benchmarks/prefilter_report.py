@@ -0,0 +1,88 @@
+"""
+Skip rate vs. recall of the empty-frame prefilter (api/prefilter.py) on a labelled sample.
+
+    python -m benchmarks.prefilter_report --images path/to/sample \\
+        --thresholds 0.0005 0.001 0.002 0.005 --batch 32
+
+The sample folder holds two subfolders, animal/ and empty/, of original camera JPEGs
+(the EXIF camera and capture time are needed). Images are scored the way uploads
+are, in batches of --batch taken in capture order (0 = all at once). Peer settings
+come from the PREFILTER_* environment variables, as in the app.
+
+recall      animal images still sent to the detector (missing one is the cost)
+skip rate   all images that would skip the detector (the saving)
+"""
+import argparse
+import glob
+import json
+import os
+
+from api.config import PREFILTER_MIN_CHANGED
+from api.exif import read_exif
+from api.prefilter import change_scores
+
+
+def load(folder):
+    items = []
+    for label in ("animal", "empty"):
+        for path in sorted(glob.glob(os.path.join(folder, label, "*"))):
+            with open(path, "rb") as f:
+                data = f.read()
+            items.append((path, data, read_exif(data), label == "animal"))
+    if not items:
+        raise SystemExit(f"No images under {folder}/animal or {folder}/empty")
+    return items
+
+
+def score(items, batch):
+    # Uploads arrive roughly in capture order; undated images go last
+    items = sorted(items, key=lambda i: (i[2].captured_at is None, i[2].captured_at or 0, i[0]))
+    size = batch or len(items)
+    scores = {}
+    for start in range(0, len(items), size):
+        chunk = items[start:start + size]
+        scores.update(change_scores([(path, data, exif) for path, data, exif, _ in chunk]))
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="folder with animal/ and empty/ subfolders")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[PREFILTER_MIN_CHANGED],
+                        help="PREFILTER_MIN_CHANGED values to evaluate")
+    parser.add_argument("--batch", type=int, default=32, help="images per upload batch (0 = all together)")
+    parser.add_argument("--output", help="also write the rows as JSON")
+    args = parser.parse_args()
+
+    items = load(args.images)
+    labels = {path: is_animal for path, _, _, is_animal in items}
+    scores = score(items, args.batch)
+    animals = sum(labels.values())
+    empties = len(labels) - animals
+    unscored = sum(1 for s in scores.values() if s is None)
+    print(f"{len(items)} images ({animals} animal, {empties} empty), {unscored} without enough peers to score")
+
+    rows = []
+    print(f"{'threshold':>10} {'skip rate':>10} {'recall':>8} {'empty skipped':>14} {'animals missed':>15}")
+    for threshold in sorted(args.thresholds):
+        skipped = {p for p, s in scores.items() if s is not None and s < threshold}
+        missed = [p for p in skipped if labels[p]]
+        row = {
+            "threshold": threshold,
+            "skip_rate": round(len(skipped) / len(items), 4),
+            "recall": round(1 - len(missed) / animals, 4) if animals else None,
+            "empty_skip_rate": round(sum(1 for p in skipped if not labels[p]) / empties, 4) if empties else None,
+            "missed": sorted(missed),
+        }
+        rows.append(row)
+        recall = f"{row['recall']:.2%}" if row["recall"] is not None else "-"
+        empty_rate = f"{row['empty_skip_rate']:.2%}" if row["empty_skip_rate"] is not None else "-"
+        print(f"{threshold:>10g} {row['skip_rate']:>10.2%} {recall:>8} {empty_rate:>14} {len(missed):>15}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"images": len(items), "unscored": unscored, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
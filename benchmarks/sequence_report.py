@@ -0,0 +1,91 @@
+"""
+What sequence mode (api/sequences.py) saves on a folder of trail-cam uploads.
+
+    python -m benchmarks.sequence_report --media path/to/card_dump [--output report.json]
+
+Groups the photos into bursts and samples frames exactly as mode=sequence does, without
+running the model, and reports per event: frames the detector would see and bytes that
+would be stored, against uploading every file through the normal path (which can't take
+video at all; a clip is counted as every one of its frames through the detector and the
+clip itself stored). The stored frame of a burst is taken to be its largest sampled shot.
+Burst and sampling settings come from the SEQUENCE_* environment variables, as in the app.
+"""
+import argparse
+import glob
+import json
+import os
+
+import cv2
+
+from api.config import SEQUENCE_STORE_CLIPS
+from api.exif import read_exif
+from api.sequences import group_bursts, is_video, sample_indices
+
+
+def load(folder):
+    photos, videos = [], []
+    for path in sorted(glob.glob(os.path.join(folder, "**", "*"), recursive=True)):
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        if is_video(path):
+            videos.append((path, data))
+        elif cv2.haveImageReader(path):
+            photos.append((path, data, read_exif(data)))
+    if not photos and not videos:
+        raise SystemExit(f"No images or videos under {folder}")
+    return photos, videos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--media", required=True, help="folder of photos and clips (searched recursively)")
+    parser.add_argument("--output", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    photos, videos = load(args.media)
+    bursts = group_bursts(photos)
+    report = {"photos": len(photos), "videos": len(videos), "events": len(bursts) + len(videos),
+              "bursts_over_one_shot": sum(1 for b in bursts if len(b) > 1)}
+
+    # Normal path: every photo inferred and stored
+    inferred_before = len(photos)
+    stored_before = sum(len(data) for _, data, _ in photos)
+    inferred_after = sum(len(sample_indices(len(b))) for b in bursts)
+    stored_after = sum(max(len(b[i][1]) for i in sample_indices(len(b))) for b in bursts)
+
+    for path, data in videos:
+        capture = cv2.VideoCapture(path)
+        count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        ok, frame = capture.read()
+        capture.release()
+        frame_bytes = len(cv2.imencode(".jpg", frame)[1]) if ok else 0
+        inferred_before += count
+        stored_before += len(data)
+        inferred_after += len(sample_indices(count))
+        stored_after += frame_bytes + (len(data) if SEQUENCE_STORE_CLIPS else 0)
+
+    events = report["events"]
+    report.update({
+        "detector_frames": {"per_file": inferred_before, "sequence_mode": inferred_after,
+                            "per_event_before": round(inferred_before / events, 2),
+                            "per_event_after": round(inferred_after / events, 2)},
+        "stored_bytes": {"per_file": stored_before, "sequence_mode": stored_after,
+                         "per_event_before": round(stored_before / events),
+                         "per_event_after": round(stored_after / events)},
+    })
+    print(f"{report['photos']} photos + {report['videos']} clips -> {events} events "
+          f"({report['bursts_over_one_shot']} multi-shot bursts)")
+    print(f"detector frames: {inferred_before} -> {inferred_after} "
+          f"({inferred_before / max(inferred_after, 1):.1f}x fewer)")
+    print(f"stored bytes:    {stored_before} -> {stored_after} "
+          f"({stored_before / max(stored_after, 1):.1f}x less)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+-- One row per image a user has uploaded, keyed by content hash.
+-- Replaces the `metadata LIKE '%<md5>%'` duplicate scan over user_detections.
+CREATE TABLE IF NOT EXISTS user_images (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_id VARCHAR(64) NOT NULL,
+    file_hash CHAR(32) NOT NULL,
+    image_name VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_user_images_user_hash (user_id, file_hash),
+    KEY idx_user_images_user_name (user_id, image_name)
+);
+
+-- Backfill from the hashes process_images has been embedding in detection metadata
+INSERT IGNORE INTO user_images (user_id, file_hash, image_name, created_at)
+SELECT user_id,
+       JSON_UNQUOTE(JSON_EXTRACT(metadata, '$.file_hash')) AS file_hash,
+       MIN(image_name),
+       MIN(timestamp)
+FROM user_detections
+WHERE JSON_EXTRACT(metadata, '$.file_hash') IS NOT NULL
+GROUP BY user_id, file_hash;
@@ -0,0 +1,16 @@
+-- EXIF metadata now lives once per image on user_images instead of being
+-- copied onto every detection row.
+ALTER TABLE user_images ADD COLUMN metadata JSON NULL;
+
+-- New detection rows leave metadata empty; keep the column's type (TEXT, holding
+-- json.dumps output) and only drop NOT NULL.
+ALTER TABLE user_detections MODIFY metadata TEXT NULL;
+
+UPDATE user_images i
+JOIN (
+    SELECT user_id, image_name, ANY_VALUE(metadata) AS metadata
+    FROM user_detections
+    WHERE metadata IS NOT NULL
+    GROUP BY user_id, image_name
+) d ON d.user_id = i.user_id AND d.image_name = i.image_name
+SET i.metadata = d.metadata;
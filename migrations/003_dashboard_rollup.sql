@@ -0,0 +1,31 @@
+-- Per-user dashboard aggregates, maintained incrementally by process_images,
+-- update_detection and delete_image (see api/rollup.py).
+-- Rows with detected_class = '' carry image counts; the rest carry detection counts.
+CREATE TABLE IF NOT EXISTS user_detection_rollup (
+    user_id VARCHAR(64) NOT NULL,
+    detected_class VARCHAR(64) NOT NULL,
+    camera VARCHAR(255) NOT NULL DEFAULT '',
+    day DATE NOT NULL,
+    image_count INT NOT NULL DEFAULT 0,
+    detection_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, detected_class, camera, day)
+);
+
+INSERT INTO user_detection_rollup (user_id, detected_class, camera, day, image_count, detection_count)
+SELECT user_id, '', COALESCE(JSON_UNQUOTE(JSON_EXTRACT(metadata, '$.camera')), '') AS camera,
+       DATE(created_at) AS day, COUNT(*), 0
+FROM user_images
+GROUP BY user_id, camera, day
+ON DUPLICATE KEY UPDATE image_count = VALUES(image_count);
+
+INSERT INTO user_detection_rollup (user_id, detected_class, camera, day, image_count, detection_count)
+SELECT d.user_id, d.detected_class, COALESCE(JSON_UNQUOTE(JSON_EXTRACT(i.metadata, '$.camera')), '') AS camera,
+       DATE(i.created_at) AS day, 0, COUNT(*)
+FROM user_detections d
+-- By hash, not name: camera filenames repeat (IMG_0001.JPG) and would count a
+-- detection once per same-named image
+JOIN user_images i
+  ON i.user_id = d.user_id
+ AND i.file_hash = JSON_UNQUOTE(JSON_EXTRACT(IF(JSON_VALID(d.metadata), d.metadata, NULL), '$.file_hash'))
+GROUP BY d.user_id, d.detected_class, camera, day
+ON DUPLICATE KEY UPDATE detection_count = VALUES(detection_count);
@@ -0,0 +1,18 @@
+-- Keyset pagination for /user/<id>/tagged-images: pages walk user_images by
+-- (created_at, id); detections are fetched per page by (user_id, image_name).
+ALTER TABLE user_images
+    ADD COLUMN detection_count INT NOT NULL DEFAULT 0,
+    ADD KEY idx_user_images_user_created (user_id, created_at, id);
+
+-- By hash, not name: camera filenames repeat (IMG_0001.JPG) across uploads
+UPDATE user_images i
+JOIN (
+    SELECT user_id, JSON_UNQUOTE(JSON_EXTRACT(IF(JSON_VALID(metadata), metadata, NULL), '$.file_hash')) AS file_hash,
+           COUNT(*) AS n
+    FROM user_detections
+    GROUP BY user_id, file_hash
+) d ON d.user_id = i.user_id AND d.file_hash = i.file_hash
+SET i.detection_count = d.n;
+
+ALTER TABLE user_detections
+    ADD KEY idx_user_detections_user_image (user_id, image_name);
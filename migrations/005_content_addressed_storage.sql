@@ -0,0 +1,7 @@
+-- Stored objects are named after the file content hash rather than the
+-- client-supplied filename. Older rows keep pointing at their filename.
+ALTER TABLE user_images
+    ADD COLUMN storage_key VARCHAR(255) NULL,
+    ADD KEY idx_user_images_storage_key (storage_key);
+
+UPDATE user_images SET storage_key = image_name WHERE storage_key IS NULL;
@@ -0,0 +1,15 @@
+-- Camera and capture time get their own indexed columns so filters and the
+-- rollup bookkeeping don't parse the metadata JSON. New uploads store a compact
+-- EXIF record in metadata; older rows keep their full tag dump.
+ALTER TABLE user_images
+    ADD COLUMN camera VARCHAR(255) NULL,
+    ADD COLUMN captured_at DATETIME NULL,
+    ADD KEY idx_user_images_user_camera (user_id, camera, created_at),
+    ADD KEY idx_user_images_user_captured (user_id, captured_at);
+
+-- camera must match what user_detection_rollup was built from ('$.camera')
+UPDATE user_images
+SET camera = NULLIF(LEFT(JSON_UNQUOTE(JSON_EXTRACT(metadata, '$.camera')), 255), ''),
+    captured_at = STR_TO_DATE(LEFT(JSON_UNQUOTE(JSON_EXTRACT(metadata, '$.DateTimeOriginal')), 19),
+                              '%Y:%m:%d %H:%i:%s')
+WHERE metadata IS NOT NULL;
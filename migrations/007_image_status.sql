@@ -0,0 +1,5 @@
+-- How an image's detections were produced: 'detected' (ran the model), 'cached'
+-- (same bytes seen before with the same model) or 'prefiltered' (judged an empty
+-- false trigger by api/prefilter.py, detector skipped).
+ALTER TABLE user_images
+    ADD COLUMN status VARCHAR(16) NOT NULL DEFAULT 'detected';
@@ -0,0 +1,6 @@
+-- Sequence mode (api/sequences.py) stores a burst or video clip as one
+-- representative frame with status 'sequence'. For clips the original video is
+-- kept as well; clip_key points at it so deletes can tell when it is unreferenced.
+ALTER TABLE user_images
+    ADD COLUMN clip_key VARCHAR(255) NULL,
+    ADD KEY idx_user_images_clip_key (clip_key);
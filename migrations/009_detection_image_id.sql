@@ -0,0 +1,34 @@
+-- Detections were tied to their image only by (user_id, image_name), and client
+-- filenames repeat across SD-card dumps (IMG_0001.JPG). image_id points at the
+-- exact user_images row; image_name stays for display and older clients.
+ALTER TABLE user_detections
+    ADD COLUMN image_id BIGINT UNSIGNED NULL,
+    ADD KEY idx_user_detections_image (image_id);
+
+-- Exact where the detection still carries its upload's hash (rows from before 002)
+UPDATE user_detections d
+JOIN user_images i
+  ON i.user_id = d.user_id
+ AND i.file_hash = JSON_UNQUOTE(JSON_EXTRACT(IF(JSON_VALID(d.metadata), d.metadata, NULL), '$.file_hash'))
+SET d.image_id = i.id
+WHERE d.image_id IS NULL;
+
+-- Otherwise by name; where a name was reused the earliest image keeps the rows
+UPDATE user_detections d
+JOIN (
+    SELECT user_id, image_name, MIN(id) AS id
+    FROM user_images
+    GROUP BY user_id, image_name
+) i ON i.user_id = d.user_id AND i.image_name = d.image_name
+SET d.image_id = i.id
+WHERE d.image_id IS NULL;
+
+-- Counts written while detections were matched by name could span same-named images
+UPDATE user_images i
+LEFT JOIN (
+    SELECT image_id, COUNT(*) AS n
+    FROM user_detections
+    WHERE image_id IS NOT NULL
+    GROUP BY image_id
+) d ON d.image_id = i.id
+SET i.detection_count = COALESCE(d.n, 0);
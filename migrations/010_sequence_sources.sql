@@ -0,0 +1,11 @@
+-- Sequence mode stores one frame per burst or clip, so the hashes of the other
+-- files in it never reach user_images. Each source file's hash is kept here,
+-- pointing at the image it was collapsed into, so re-uploading any of them is
+-- caught as a duplicate before it is decoded.
+CREATE TABLE IF NOT EXISTS user_image_sources (
+    user_id VARCHAR(64) NOT NULL,
+    file_hash CHAR(32) NOT NULL,
+    image_id BIGINT UNSIGNED NOT NULL,
+    PRIMARY KEY (user_id, file_hash),
+    KEY idx_user_image_sources_image (image_id)
+);
@@ -0,0 +1,14 @@
+-- Shopify webhook delivery ids, shared by every web worker: the flusher records a
+-- delivery here in the same transaction as its upsert and skips ones another
+-- process already wrote. Rows older than WEBHOOK_DEDUP_TTL are pruned by the flusher.
+CREATE TABLE IF NOT EXISTS webhook_deliveries (
+    webhook_id VARCHAR(64) NOT NULL PRIMARY KEY,
+    flush_token CHAR(32) NOT NULL,
+    received_at DATETIME NOT NULL,
+    KEY idx_webhook_deliveries_token (flush_token),
+    KEY idx_webhook_deliveries_received (received_at)
+);
+
+-- Shopify's own updated_at (UTC), so a late, older delivery can't overwrite a newer one
+ALTER TABLE customers
+    ADD COLUMN shopify_updated_at DATETIME NULL;
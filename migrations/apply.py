@@ -0,0 +1,68 @@
+"""
+Apply the numbered .sql files in this folder, in order, against DB_CONFIG.
+
+    python -m migrations.apply            # apply pending migrations
+    python -m migrations.apply --list     # show applied / pending
+"""
+import argparse
+import glob
+import os
+
+import mysql.connector
+
+from api.config import DB_CONFIG, logger
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def split_statements(sql):
+    statements, current = [], []
+    for line in sql.splitlines():
+        if line.strip().startswith("--"):
+            continue
+        current.append(line)
+        if line.rstrip().endswith(";"):
+            statements.append("\n".join(current).strip().rstrip(";"))
+            current = []
+    if "".join(current).strip():
+        statements.append("\n".join(current).strip())
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--list", action="store_true", help="only list migration status")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name VARCHAR(255) NOT NULL PRIMARY KEY,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT name FROM schema_migrations")
+    applied = {row[0] for row in cur.fetchall()}
+
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+        name = os.path.basename(path)
+        if args.list:
+            print(f"{'applied' if name in applied else 'pending':>8}  {name}")
+            continue
+        if name in applied:
+            continue
+
+        logger.info("Applying migration %s", name)
+        with open(path) as f:
+            for statement in split_statements(f.read()):
+                cur.execute(statement)
+        cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+        conn.commit()
+
+    cur.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()